@@ -1,5 +1,16 @@
-from sqladmin import ModelView
-from sqlalchemy import func
+from sqladmin import BaseView, ModelView, action, expose
+from sqladmin.ajax import QueryAjaxModelLoader
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import selectinload, undefer
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import Request
+from starlette.responses import RedirectResponse
+from caching import track_view_tables
+from pagination import KeysetPaginationMixin
+from jobs import job_result, recent_jobs, runner
+from pricing import price_matrix, price_version
+from reports import sales_dashboard
+from search import customer_ids_lookup, customer_ids_matching, product_ids_matching, quarry_ids_matching
 from models import (
     ProductCategory, 
     ProductType, 
@@ -8,10 +19,21 @@ from models import (
     Customer, 
     Order,
     OrderTruck,
-    TruckType
+    TruckType,
+    ArchivedOrder,
+    ArchivedOrderTruck
 )
 
 
+def _jobs_url(request):
+    return request.url_for("admin:index").replace(path=request.url_for("admin:index").path + "jobs")
+
+
+def _job_redirect(request, job_id):
+    """Переход на страницу фоновых задач после постановки задачи в очередь"""
+    return RedirectResponse(str(_jobs_url(request).include_query_params(job=job_id)), status_code=303)
+
+
 class ProductCategoryAdmin(ModelView, model=ProductCategory):
     name = "Категория товара"
     name_plural = "Категории товаров"
@@ -19,6 +41,9 @@ class ProductCategoryAdmin(ModelView, model=ProductCategory):
     column_searchable_list = ["name"]
     column_default_sort = [("name", False)]
     page_size = 20
+    # Таблицы, от которых зависят страницы раздела (ETag, см. caching.py);
+    # просмотр категории показывает ее виды товаров
+    cache_tables = ("productcategory", "producttype")
 
 class ProductTypeAdmin(ModelView, model=ProductType):
     name = "Вид товара"
@@ -28,6 +53,7 @@ class ProductTypeAdmin(ModelView, model=ProductType):
     column_sortable_list = ["category_id"]
     form_columns = ["name", "category_id", "base_unit"]
     page_size = 20
+    cache_tables = ("producttype", "productcategory")
     
     # Добавляем автодополнение для категории
     form_ajax_refs = {
@@ -44,10 +70,39 @@ class QuarryProductPriceAdmin(ModelView, model=QuarryProductPrice):
     form_columns = ["quarry", "product", "price"]
     column_searchable_list = ["quarry.name", "product.name"]
     page_size = 20
+    cache_tables = ("quarryproductprice", "quarry", "producttype")
     
-    def after_model_change(self, data, model, is_created):
+    async def on_model_change(self, data, model, is_created, request):
         """Обновляем дату обновления при изменении цены"""
         model.updated_at = func.now()
+        # Прежняя ячейка матрицы: при смене карьера или товара ее нужно убрать
+        request.state.old_price_key = None if is_created else (model.quarry_id, model.product_id)
+
+    async def after_model_change(self, data, model, is_created, request):
+        """Обновляем ячейку матрицы цен (версию цен увеличило ORM-событие при сохранении)"""
+        version = await run_in_threadpool(price_version)
+        old_key = getattr(request.state, "old_price_key", None)
+        price_matrix.set(model.quarry_id, model.product_id, model.price, version, old_key=old_key)
+
+    async def after_model_delete(self, model, request):
+        version = await run_in_threadpool(price_version)
+        price_matrix.discard(model.quarry_id, model.product_id, version)
+
+    @action(
+        name="reprice_orders",
+        label="Пересчитать открытые заказы",
+        confirmation_message="Привести цену открытых заказов к выбранным ценам карьеров?",
+        add_in_detail=True,
+        add_in_list=True,
+    )
+    async def reprice_orders(self, request: Request):
+        price_ids = [int(pk) for pk in request.query_params.get("pks", "").split(",") if pk]
+        if not price_ids:
+            return RedirectResponse(request.url_for("admin:list", identity=self.identity))
+        job_id = await run_in_threadpool(
+            runner.enqueue, "reprice", price_ids=price_ids, reason="Изменение цены в админке"
+        )
+        return _job_redirect(request, job_id)
 
 class QuarryAdmin(ModelView, model=Quarry):
     name = "Карьер"
@@ -57,6 +112,8 @@ class QuarryAdmin(ModelView, model=Quarry):
     column_searchable_list = ["name"]
     form_columns = ["name", "location", "is_active"]
     page_size = 20
+    # Просмотр карьера показывает его цены (с названиями товаров)
+    cache_tables = ("quarry", "quarryproductprice", "producttype")
 
 class CustomerAdmin(ModelView, model=Customer):
     name = "Клиент"
@@ -66,6 +123,10 @@ class CustomerAdmin(ModelView, model=Customer):
     form_columns = ["full_name", "phone", "email", "address"]
     page_size = 20
 
+    def search_query(self, stmt, term):
+        # Поиск по полнотекстовому индексу вместо LIKE-сканирования таблицы
+        return stmt.where(Customer.id.in_(customer_ids_matching(term)))
+
 class TruckTypeAdmin(ModelView, model=TruckType):
     name = "Тип машины"
     name_plural = "Типы машин"
@@ -73,6 +134,7 @@ class TruckTypeAdmin(ModelView, model=TruckType):
     form_columns = ["name", "volume", "load_capacity", "description"]
     column_searchable_list = ["name"]
     page_size = 20
+    cache_tables = ("trucktype",)
 
 
 class OrderTruckInline(ModelView, model=OrderTruck):
@@ -89,8 +151,8 @@ class OrderTruckInline(ModelView, model=OrderTruck):
     
     # Форматируем вычисляемые поля
     column_formatters = {
-        "total_volume": lambda m, a: f"{m.truck_type.volume * m.count} м³",
-        "total_capacity": lambda m, a: f"{m.truck_type.load_capacity * m.count} тонн"
+        "total_volume": lambda m, a: f"{m.total_volume} м³",
+        "total_capacity": lambda m, a: f"{m.total_capacity} тонн"
     }
     
     def get_related_objects(self, obj: OrderTruck):
@@ -100,7 +162,40 @@ class OrderTruckInline(ModelView, model=OrderTruck):
                 db.refresh(obj, ['truck_type'])
         return obj
 
-class OrderAdmin(ModelView, model=Order):
+class UnderProvisionedFilter:
+    """Фильтр заказов, для которых вместимости назначенных машин не хватает"""
+
+    title = "Машин достаточно"
+    parameter_name = "under_provisioned"
+    has_operator = False
+    template = "sqladmin/filters/lookup_filter.html"
+
+    async def lookups(self, request, model, run_query):
+        return [("all", "Все"), ("yes", "Не хватает машин"), ("no", "Машин достаточно")]
+
+    async def get_filtered_query(self, query, value, model=None):
+        if value in ("yes", "no"):
+            query = query.options(undefer(Order.fleet_volume), undefer(Order.fleet_capacity))
+        if value == "yes":
+            return query.where(Order.is_under_provisioned)
+        if value == "no":
+            return query.where(~Order.is_under_provisioned)
+        return query
+
+class CustomerLookupLoader(QueryAjaxModelLoader):
+    """Автодополнение клиента: поиск по индексам (префикс телефона/email, FTS по ФИО) вместо LIKE по всем полям"""
+
+    async def get_list(self, request, term):
+        stmt = (
+            select(Customer)
+            .where(Customer.id.in_(customer_ids_lookup(term)))
+            .order_by(*self._cached_fields_order_by)
+            .limit(self.limit)
+        )
+        return await self.model_admin._run_query(stmt)
+
+
+class OrderAdmin(KeysetPaginationMixin, ModelView, model=Order):
     name = "Заказ"
     name_plural = "Заказы"
     column_list = [
@@ -114,15 +209,25 @@ class OrderAdmin(ModelView, model=Order):
         "status",
         "created_at",
         "delivery_address",
+        "item_total",
+        "fleet_total",
         "trucks_summary"
     ]
+    column_labels = {
+        "item_total": "Стоимость товара",
+        "fleet_total": "Вместимость машин",
+    }
     column_searchable_list = [
         "customer.full_name", 
         "customer.phone",
         "product.name",
         "quarry.name"
     ]
-    column_sortable_list = ["created_at", "status", "quantity"]
+    column_sortable_list = ["created_at", "status", "quantity", "item_total", "fleet_total"]
+    # Отложенные подзапросы вместимости машин нужны только списку, на просмотре — сводка машин
+    column_details_exclude_list = ["fleet_volume", "fleet_capacity"]
+    column_default_sort = [("created_at", True)]
+    column_filters = [UnderProvisionedFilter()]
     form_columns = [
         "customer", 
         "product", 
@@ -136,6 +241,22 @@ class OrderAdmin(ModelView, model=Order):
     inline_models = [OrderTruckInline]  # Только машины
     page_size = 20
     
+    # Выбор клиента в форме заказа — автодополнением (см. CustomerLookupLoader)
+    form_ajax_refs = {
+        'customer': {
+            'fields': (Customer.full_name, Customer.phone, Customer.email),
+            'order_by': Customer.full_name,
+        }
+    }
+    
+    # Максимум SQL-запросов на страницы раздела (не зависит от размера страницы),
+    # проверяется тестами (tests/test_query_budget.py) и bench.py. Список: count, заказы, клиенты, товары, карьеры,
+    # машины вместе с типами; просмотр: заказ и те же справочники и машины;
+    # редактирование: заказ для проверки прав и для формы, списки товаров и карьеров
+    list_query_budget = 6
+    details_query_budget = 5
+    edit_query_budget = 11
+    
     # Форматирование даты
     column_formatters = {
         "created_at": lambda m, a: m.created_at.strftime("%d.%m.%Y %H:%M")
@@ -144,7 +265,7 @@ class OrderAdmin(ModelView, model=Order):
     # Вычисляемое поле для общей стоимости товара
     column_formatters_detail = {
         "trucks_summary": lambda m, a: m.trucks_summary,
-        "item_total": lambda m, a: m.quantity * m.price_per_unit
+        "item_total": lambda m, a: m.item_total
     }
 
     @property
@@ -163,3 +284,238 @@ class OrderAdmin(ModelView, model=Order):
     }
 
     inline_models = [OrderTruckInline]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._form_ajax_refs["customer"] = CustomerLookupLoader(
+            "customer", Customer, self, **self.form_ajax_refs["customer"]
+        )
+
+    def _with_trucks(self, stmt):
+        """Загружает машины заказов и их типы одним запросом на страницу"""
+        return stmt.options(
+            selectinload(Order.trucks).joinedload(OrderTruck.truck_type)
+        )
+
+    def list_query(self, request: Request):
+        # Вместимость машин (fleet_total) показывается только в списке
+        return self._with_trucks(select(Order)).options(
+            undefer(Order.fleet_volume), undefer(Order.fleet_capacity)
+        )
+
+    def search_query(self, stmt, term):
+        # Ищем id в справочниках и фильтруем заказы по индексированным внешним ключам без JOIN
+        return stmt.where(or_(
+            Order.customer_id.in_(customer_ids_matching(term)),
+            Order.product_id.in_(product_ids_matching(term)),
+            Order.quarry_id.in_(quarry_ids_matching(term)),
+        ))
+
+    def details_query(self, request: Request):
+        # Заказ по первичному ключу из адреса, его машины — одним запросом
+        return self._with_trucks(self.form_details_query(request))
+
+    async def get_object_for_details(self, request: Request):
+        # sqladmin загружает заказ для check_can_view_details и еще раз для страницы:
+        # в пределах запроса повторно берем уже загруженный
+        loaded = getattr(request.state, "loaded_orders", None)
+        if loaded is None:
+            loaded = request.state.loaded_orders = {}
+        pk = request.path_params.get("pk")
+        if pk not in loaded:
+            loaded[pk] = await super().get_object_for_details(request)
+        return loaded[pk]
+
+    @action(
+        name="plan_trucks",
+        label="Подобрать машины",
+        confirmation_message="Заменить машины выбранных заказов подобранными автоматически?",
+        add_in_detail=True,
+        add_in_list=True,
+    )
+    async def plan_trucks(self, request: Request):
+        order_ids = [int(pk) for pk in request.query_params.get("pks", "").split(",") if pk]
+        if not order_ids:
+            return RedirectResponse(request.url_for("admin:list", identity=self.identity))
+        job_id = await run_in_threadpool(runner.enqueue, "plan_trucks", order_ids=order_ids)
+        return _job_redirect(request, job_id)
+
+    async def _set_status(self, request: Request, status):
+        order_ids = [int(pk) for pk in request.query_params.get("pks", "").split(",") if pk]
+        if not order_ids:
+            return RedirectResponse(request.url_for("admin:list", identity=self.identity))
+        job_id = await run_in_threadpool(runner.enqueue, "set_status", order_ids=order_ids, status=status)
+        return _job_redirect(request, job_id)
+
+    @action(
+        name="mark_in_progress",
+        label="Статус: в работе",
+        confirmation_message="Перевести выбранные заказы в работу?",
+        add_in_detail=False,
+        add_in_list=True,
+    )
+    async def mark_in_progress(self, request: Request):
+        return await self._set_status(request, "in_progress")
+
+    @action(
+        name="mark_completed",
+        label="Статус: выполнен",
+        confirmation_message="Отметить выбранные заказы выполненными?",
+        add_in_detail=False,
+        add_in_list=True,
+    )
+    async def mark_completed(self, request: Request):
+        return await self._set_status(request, "completed")
+
+    @action(
+        name="mark_cancelled",
+        label="Статус: отменен",
+        confirmation_message="Отменить выбранные заказы?",
+        add_in_detail=False,
+        add_in_list=True,
+    )
+    async def mark_cancelled(self, request: Request):
+        return await self._set_status(request, "cancelled")
+
+    @action(
+        name="export_csv",
+        label="Выгрузить в CSV",
+        add_in_detail=False,
+        add_in_list=True,
+    )
+    async def export_csv(self, request: Request):
+        url = request.url_for("export_orders_csv")
+        pks = request.query_params.get("pks", "")
+        return RedirectResponse(str(url.include_query_params(ids=pks)) if pks else str(url))
+
+
+class ArchivedOrderAdmin(KeysetPaginationMixin, ModelView, model=ArchivedOrder):
+    name = "Архивный заказ"
+    name_plural = "Архив заказов"
+    icon = "fa-solid fa-box-archive"
+    can_create = False
+    can_edit = False
+    can_delete = False
+    column_list = [
+        "id",
+        "customer",
+        "product",
+        "quarry",
+        "quantity",
+        "total_price",
+        "status",
+        "created_at",
+        "archived_at",
+        "trucks_summary"
+    ]
+    column_details_list = column_list + ["price_per_unit", "delivery_address"]
+    column_searchable_list = [
+        "customer.full_name",
+        "customer.phone",
+        "product.name",
+        "quarry.name"
+    ]
+    column_sortable_list = ["created_at", "status", "quantity"]
+    column_default_sort = [("created_at", True)]
+    page_size = 20
+    
+    column_formatters = {
+        "trucks_summary": lambda m, a: m.trucks_summary,
+        "created_at": lambda m, a: m.created_at.strftime("%d.%m.%Y %H:%M") if m.created_at else ""
+    }
+    column_formatters_detail = {
+        "trucks_summary": lambda m, a: m.trucks_summary
+    }
+
+    def _with_trucks(self, stmt):
+        return stmt.options(
+            selectinload(ArchivedOrder.trucks).joinedload(ArchivedOrderTruck.truck_type)
+        )
+
+    def list_query(self, request: Request):
+        return self._with_trucks(select(ArchivedOrder))
+
+    def details_query(self, request: Request):
+        return self._with_trucks(self.form_details_query(request))
+
+    def search_query(self, stmt, term):
+        return stmt.where(or_(
+            ArchivedOrder.customer_id.in_(customer_ids_matching(term)),
+            ArchivedOrder.product_id.in_(product_ids_matching(term)),
+            ArchivedOrder.quarry_id.in_(quarry_ids_matching(term)),
+        ))
+
+
+class SalesDashboardAdmin(BaseView):
+    name = "Продажи"
+    icon = "fa-solid fa-chart-line"
+
+    @expose("/sales", methods=["GET"])
+    async def sales(self, request: Request):
+        try:
+            days = min(max(int(request.query_params.get("days", 30)), 1), 366)
+        except ValueError:
+            days = 30
+        data = await run_in_threadpool(sales_dashboard, days)
+        return await self.templates.TemplateResponse(
+            request, "sales_dashboard.html", context={"days": days, **data}
+        )
+
+
+class JobsAdmin(BaseView):
+    name = "Фоновые задачи"
+    icon = "fa-solid fa-list-check"
+    # Задачи, которые можно запустить со страницы (без параметров).
+    # Перезаполнение БД (seed) стирает все данные, поэтому его здесь нет — только из консоли
+    page_jobs = {
+        "plan_trucks": "Подобрать машины открытым заказам",
+        "archive": "Перенести закрытые заказы в архив",
+        "dedup_customers": "Найти дубли клиентов",
+    }
+
+    @expose("/jobs", methods=["GET"])
+    async def jobs(self, request: Request):
+        current = request.query_params.get("job")
+        jobs = await run_in_threadpool(recent_jobs)
+        # Найденные дубли клиентов показываются для проверки перед объединением
+        duplicates = None
+        if current and any(job.id == current and job.name == "dedup_customers" for job in jobs):
+            row = await run_in_threadpool(job_result, current)
+            if row is not None and row[0] == "done" and row[2] and "items" in row[2]:
+                duplicates = row[2]
+        return await self.templates.TemplateResponse(
+            request, "jobs.html",
+            context={"jobs": jobs, "page_jobs": self.page_jobs, "current": current, "duplicates": duplicates},
+        )
+
+    @expose("/jobs/start", methods=["POST"])
+    async def start_job(self, request: Request):
+        """Запуск задач со страницы без параметров; поиск дублей клиентов только показывает группы"""
+        form = await request.form()
+        name = form.get("name")
+        if name not in self.page_jobs:
+            return RedirectResponse(_jobs_url(request), status_code=303)
+        job_id = await run_in_threadpool(runner.enqueue, name)
+        return _job_redirect(request, job_id)
+
+    @expose("/jobs/merge-customers", methods=["POST"])
+    async def merge_customers(self, request: Request):
+        """Объединение отмеченных после проверки групп дублей клиентов"""
+        form = await request.form()
+        # Каждая отмеченная группа приходит с id клиентов, которые видел оператор
+        groups = []
+        for value in form.getlist("group"):
+            members = value.split(",")
+            if len(members) > 1 and all(member.isdigit() for member in members):
+                groups.append([int(member) for member in members])
+        if not groups:
+            return RedirectResponse(_jobs_url(request), status_code=303)
+        job_id = await run_in_threadpool(runner.enqueue, "dedup_customers", dry_run=False, groups=groups)
+        return _job_redirect(request, job_id)
+
+
+# Изменения через ORM увеличивают версии только таблиц, от которых зависят кеши разделов
+track_view_tables(
+    ProductCategoryAdmin, ProductTypeAdmin, QuarryProductPriceAdmin, QuarryAdmin,
+    CustomerAdmin, TruckTypeAdmin, OrderAdmin,
+)
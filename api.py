@@ -0,0 +1,208 @@
+# api.py
+"""
+Версионированный JSON API для чтения: заказы с машинами, цены и типы машин.
+
+Запросы выбирают только запрошенные колонки через Core (без ORM-объектов
+и связей lazy="joined"), ответы сериализуются orjson в обход pydantic;
+pydantic-модели описывают ответы только для документации OpenAPI.
+"""
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from typing import List, Optional
+
+import orjson
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import select
+
+from database import engine, replica_engine
+from models import Customer, Order, OrderTruck, ProductType, Quarry, TruckType
+from pricing import price_matrix
+
+# Размер страницы списка заказов по умолчанию и максимальный
+API_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 1000
+
+# Все запросы API только читают, поэтому идут на реплику, если она настроена
+read_engine = replica_engine or engine
+
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ, сериализованный orjson"""
+
+    def render(self, content):
+        return orjson.dumps(content, default=_default)
+
+
+class TruckOut(BaseModel):
+    truck_type_id: int
+    truck_type: str
+    count: int
+
+
+class OrderOut(BaseModel):
+    """Заказ; присутствуют только поля, перечисленные в fields"""
+
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+    status: Optional[str] = None
+    customer_id: Optional[int] = None
+    customer: Optional[str] = None
+    phone: Optional[str] = None
+    product_id: Optional[int] = None
+    product: Optional[str] = None
+    quarry_id: Optional[int] = None
+    quarry: Optional[str] = None
+    quantity: Optional[float] = None
+    price_per_unit: Optional[float] = None
+    total_price: Optional[float] = None
+    delivery_address: Optional[str] = None
+    trucks: Optional[List[TruckOut]] = None
+
+
+class OrderPage(BaseModel):
+    items: List[OrderOut]
+    next_cursor: Optional[int] = None
+
+
+class PriceOut(BaseModel):
+    quarry_id: int
+    product_id: int
+    price: float
+
+
+class TruckTypeOut(BaseModel):
+    id: int
+    name: str
+    volume: float
+    load_capacity: float
+
+
+# Поле ответа -> (колонка, таблица, которую нужно присоединить)
+ORDER_FIELDS = {
+    "id": (Order.id, None),
+    "created_at": (Order.created_at, None),
+    "status": (Order.status, None),
+    "customer_id": (Order.customer_id, None),
+    "customer": (Customer.full_name, Customer),
+    "phone": (Customer.phone, Customer),
+    "product_id": (Order.product_id, None),
+    "product": (ProductType.name, ProductType),
+    "quarry_id": (Order.quarry_id, None),
+    "quarry": (Quarry.name, Quarry),
+    "quantity": (Order.quantity, None),
+    "price_per_unit": (Order.price_per_unit, None),
+    "total_price": (Order.total_price, None),
+    "delivery_address": (Order.delivery_address, None),
+}
+DEFAULT_ORDER_FIELDS = ("id", "created_at", "status", "customer_id", "product_id", "quarry_id", "quantity", "total_price")
+_JOINS = {
+    Customer: Customer.id == Order.customer_id,
+    ProductType: ProductType.id == Order.product_id,
+    Quarry: Quarry.id == Order.quarry_id,
+}
+
+
+def _parse_fields(fields):
+    """Список запрошенных полей; trucks — машины заказа"""
+    if not fields:
+        return list(DEFAULT_ORDER_FIELDS)
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in ORDER_FIELDS and name != "trucks"]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Неизвестные поля: {', '.join(unknown)}")
+    return names
+
+
+def _orders_query(names):
+    columns = [ORDER_FIELDS[name][0].label(name) for name in names if name in ORDER_FIELDS]
+    if "id" not in names:
+        columns.append(Order.id.label("id"))
+    stmt = select(*columns).select_from(Order)
+    tables = {ORDER_FIELDS[name][1] for name in names if name in ORDER_FIELDS}
+    for table, onclause in _JOINS.items():
+        if table in tables:
+            stmt = stmt.outerjoin(table, onclause)
+    return stmt
+
+
+def _order_items(conn, stmt, names):
+    """Строки заказов как словари только с запрошенными полями (и машинами, если нужно)"""
+    rows = conn.execute(stmt).mappings().all()
+    items = [{name: row[name] for name in names if name != "trucks"} for row in rows]
+    if "trucks" in names and rows:
+        trucks = defaultdict(list)
+        for order_id, truck_type_id, truck_type, count in conn.execute(
+            select(OrderTruck.order_id, OrderTruck.truck_type_id, TruckType.name, OrderTruck.count)
+            .join(TruckType, TruckType.id == OrderTruck.truck_type_id)
+            .where(OrderTruck.order_id.in_([row["id"] for row in rows]))
+        ):
+            trucks[order_id].append({"truck_type_id": truck_type_id, "truck_type": truck_type, "count": count})
+        for row, item in zip(rows, items):
+            item["trucks"] = trucks.get(row["id"], [])
+    return rows, items
+
+
+router = APIRouter(prefix="/api/v1", tags=["v1"], default_response_class=FastJSONResponse)
+
+
+@router.get("/orders", response_model=OrderPage)
+def list_orders(
+    after: int = Query(None, description="Курсор: next_cursor предыдущей страницы"),
+    limit: int = Query(API_PAGE_SIZE, ge=1, le=API_MAX_PAGE_SIZE),
+    fields: str = Query(None, description="Поля через запятую, trucks — машины заказа"),
+    status: str = Query(None),
+    customer_id: int = Query(None),
+    quarry_id: int = Query(None),
+    product_id: int = Query(None),
+):
+    """Заказы от новых к старым с keyset-пагинацией по id"""
+    names = _parse_fields(fields)
+    stmt = _orders_query(names).order_by(Order.id.desc()).limit(limit)
+    if after is not None:
+        stmt = stmt.where(Order.id < after)
+    for column, value in ((Order.status, status), (Order.customer_id, customer_id),
+                          (Order.quarry_id, quarry_id), (Order.product_id, product_id)):
+        if value is not None:
+            stmt = stmt.where(column == value)
+    with read_engine.connect() as conn:
+        rows, items = _order_items(conn, stmt, names)
+    next_cursor = rows[-1]["id"] if len(rows) == limit else None
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+@router.get("/orders/{order_id}", response_model=OrderOut)
+def get_order(order_id: int, fields: str = Query(None, description="Поля через запятую")):
+    names = _parse_fields(fields)
+    with read_engine.connect() as conn:
+        rows, items = _order_items(conn, _orders_query(names).where(Order.id == order_id), names)
+    if not items:
+        raise HTTPException(status_code=404, detail="Заказ не найден")
+    return FastJSONResponse(items[0])
+
+
+@router.get("/prices", response_model=List[PriceOut])
+def list_prices(quarry_id: int = Query(None), product_id: int = Query(None)):
+    """Цены из матрицы в памяти, без запросов к БД"""
+    return FastJSONResponse([
+        {"quarry_id": quarry, "product_id": product, "price": price}
+        for (quarry, product), price in price_matrix.items()
+        if (quarry_id is None or quarry == quarry_id) and (product_id is None or product == product_id)
+    ])
+
+
+@router.get("/truck-types", response_model=List[TruckTypeOut])
+def list_truck_types():
+    with read_engine.connect() as conn:
+        rows = conn.execute(
+            select(TruckType.id, TruckType.name, TruckType.volume, TruckType.load_capacity).order_by(TruckType.id)
+        ).mappings().all()
+    return FastJSONResponse([dict(row) for row in rows])
@@ -0,0 +1,103 @@
+# archive.py
+"""
+Перенос закрытых заказов в архив.
+
+Заказы со статусом из ARCHIVE_STATUSES старше ARCHIVE_AFTER_DAYS дней
+вместе с машинами переносятся в таблицы orderarchive и ordertruckarchive
+пакетами по ARCHIVE_BATCH_SIZE строк, каждый пакет — отдельная короткая
+транзакция. Перенос идет через Core, минуя ORM-события, поэтому агрегаты
+продаж (dailysales) сохраняют архивные заказы.
+
+Таблицы order и ordertruck в SQLite создаются с AUTOINCREMENT (более старые
+БД пересоздаются при обновлении схемы, см. startup.py), поэтому id архивных
+строк не выдаются повторно и при переносе не конфликтуют.
+
+    python archive.py --days 180 --batch-size 5000
+"""
+import argparse
+import os
+import time
+from datetime import timedelta
+
+from sqlalchemy import and_, func, select
+
+from database import engine, utcnow
+from models import ArchivedOrder, ArchivedOrderTruck, Order, OrderTruck
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_STATUSES = ("completed", "cancelled")
+
+
+def _archivable(cutoff):
+    return and_(Order.status.in_(ARCHIVE_STATUSES), Order.created_at < cutoff)
+
+
+def archive_batch(conn, cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Переносит в архив один пакет заказов, созданных до cutoff; возвращает их число"""
+    order_ids = conn.execute(
+        select(Order.id)
+        .where(_archivable(cutoff))
+        .order_by(Order.id)
+        .limit(batch_size)
+    ).scalars().all()
+    if not order_ids:
+        return 0
+
+    orders, trucks = Order.__table__, OrderTruck.__table__
+    conn.execute(ArchivedOrder.__table__.insert().from_select(
+        [column.name for column in orders.columns],
+        select(*orders.columns).where(orders.c.id.in_(order_ids)),
+    ))
+    conn.execute(ArchivedOrderTruck.__table__.insert().from_select(
+        [column.name for column in trucks.columns],
+        select(*trucks.columns).where(trucks.c.order_id.in_(order_ids)),
+    ))
+    conn.execute(trucks.delete().where(trucks.c.order_id.in_(order_ids)))
+    conn.execute(orders.delete().where(orders.c.id.in_(order_ids)))
+    return len(order_ids)
+
+
+def archive_cutoff(days=ARCHIVE_AFTER_DAYS):
+    return utcnow() - timedelta(days=days)
+
+
+def count_archivable(days=ARCHIVE_AFTER_DAYS):
+    """Сколько заказов ждет переноса в архив"""
+    with engine.connect() as conn:
+        return conn.execute(
+            select(func.count())
+            .select_from(Order)
+            .where(_archivable(archive_cutoff(days)))
+        ).scalar()
+
+
+def archive_orders(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE, max_batches=None, on_batch=None):
+    """
+    Переносит в архив все подходящие заказы (не больше max_batches пакетов).
+    on_batch(перенесено) вызывается после каждого пакета.
+    """
+    cutoff = archive_cutoff(days)
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as conn:
+            moved = archive_batch(conn, cutoff, batch_size)
+        if not moved:
+            break
+        archived += moved
+        batches += 1
+        if on_batch is not None:
+            on_batch(archived)
+    return archived
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос закрытых заказов в архив")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Возраст заказа в днях")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Заказов в одной транзакции")
+    parser.add_argument("--max-batches", type=int, help="Ограничить число пакетов за запуск")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    archived = archive_orders(args.days, args.batch_size, args.max_batches)
+    print(f"✅ В архив перенесено заказов: {archived} за {time.perf_counter() - started:.1f} с")
@@ -0,0 +1,264 @@
+# bench.py
+"""
+Нагрузочный бенчмарк страниц админки.
+
+Заполняет отдельную БД синтетическими данными (scipt.generate_data),
+запускает приложение в том же процессе через ASGI и для каждого раздела
+админки измеряет страницы списка, поиска, сортировки, просмотра и
+редактирования: p50/p95/p99, пропускную способность и число SQL-запросов.
+Перед замерами проверяет, что соседние страницы keyset-списков
+не пересекаются, после — что страницы укладываются в бюджеты SQL-запросов
+разделов (list_query_budget, details_query_budget, edit_query_budget);
+иначе код выхода 1.
+
+    python bench.py --scale 0.01 --save bench_baseline.json
+    python bench.py --scale 0.01 --baseline bench_baseline.json --tolerance 0.25
+
+При сравнении с базовой линией код выхода 1 означает регрессию.
+"""
+import argparse
+import asyncio
+import html
+import json
+import os
+import re
+import statistics
+import sys
+import tempfile
+import time
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _pages(admin, db):
+    """Адреса страниц для каждого зарегистрированного ModelView"""
+    from sqladmin import ModelView
+    from sqlalchemy import select
+
+    pages = {}
+    for view in admin.views:
+        if not isinstance(view, ModelView):
+            continue
+        base = f"/admin/{view.identity}"
+        pages[f"{view.identity}:list"] = f"{base}/list"
+        if view.column_searchable_list:
+            pages[f"{view.identity}:search"] = f"{base}/list?search=100"
+        if view.column_sortable_list:
+            sort_by = view.column_sortable_list[0]
+            sort_by = sort_by if isinstance(sort_by, str) else sort_by.key
+            pages[f"{view.identity}:sort"] = f"{base}/list?sortBy={sort_by}&sort=desc"
+        pk = db.execute(select(*view.model.__mapper__.primary_key).limit(1)).scalar()
+        if pk is not None:
+            pages[f"{view.identity}:details"] = f"{base}/details/{pk}"
+            if view.can_edit:
+                pages[f"{view.identity}:edit"] = f"{base}/edit/{pk}"
+    return pages
+
+
+def _add_admin_orders(db, count):
+    """
+    Заказы, созданные через ORM, как из админки: created_at заполняет БД
+    без долей секунды, и все они попадают в одну-две секунды
+    """
+    from sqlalchemy import select
+
+    from models import Order
+
+    template = db.execute(select(Order).limit(1)).scalar()
+    if template is None:
+        return
+    db.add_all(
+        Order(
+            customer_id=template.customer_id,
+            product_id=template.product_id,
+            quarry_id=template.quarry_id,
+            quantity=template.quantity,
+            price_per_unit=template.price_per_unit,
+            total_price=template.total_price,
+            delivery_address=template.delivery_address,
+            status=template.status,
+        )
+        for _ in range(count)
+    )
+    db.commit()
+
+
+async def check_pagination(client, admin):
+    """Список ошибок: строки, попавшие на две соседние страницы keyset-списка"""
+    from pagination import KeysetPaginationMixin
+
+    problems = []
+    for view in admin.views:
+        if not isinstance(view, KeysetPaginationMixin):
+            continue
+        base = f"/admin/{view.identity}/list"
+        row_link = re.compile(rf"/admin/{view.identity}/details/(\d+)")
+        for first_url in (base, f"{base}?sortBy={view.keyset_column}&sort=asc"):
+            response = await client.get(first_url)
+            first = set(row_link.findall(response.text))
+            # Следующая страница по ссылке с курсором и по номеру (курсор из кеша)
+            next_links = [html.unescape(url) for url in re.findall(r'href="([^"]*[?&]page=2[^"]*)"', response.text)]
+            for second_url in next_links[:1] + [f"{first_url}{'&' if '?' in first_url else '?'}page=2"]:
+                second = set(row_link.findall((await client.get(second_url)).text))
+                overlap = first & second
+                if overlap:
+                    problems.append(f"{second_url}: {len(overlap)} строк повторяют страницу 1")
+    return problems
+
+
+def over_budget(admin, results):
+    """Список страниц, выполнивших больше SQL-запросов, чем задано в бюджете раздела"""
+    failures = []
+    for view in admin.views:
+        for name, result in results.items():
+            identity, page = name.split(":")
+            if identity != view.identity:
+                continue
+            kind = "list" if page in ("search", "sort") else page
+            budget = getattr(view, f"{kind}_query_budget", None)
+            if budget is not None and result["statements"] > budget:
+                failures.append(f"{name}: SQL-запросов {result['statements']} при бюджете {budget}")
+    return failures
+
+
+async def _measure(client, url, requests, concurrency):
+    from database import count_queries
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    statements = []
+    statuses = set()
+
+    async def one():
+        async with semaphore:
+            with count_queries() as counter:
+                started = time.perf_counter()
+                response = await client.get(url)
+                latencies.append(time.perf_counter() - started)
+            statements.append(counter.count)
+            statuses.add(response.status_code)
+
+    await one()  # прогрев
+    latencies.clear()
+    statements.clear()
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    return {
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "rps": round(requests / elapsed, 1),
+        "statements": max(statements),
+        "status": sorted(statuses),
+    }
+
+
+async def run(pages, app, admin, requests, concurrency):
+    import httpx
+
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        problems = await check_pagination(client, admin)
+        if problems:
+            print("❌ Страницы списков пересекаются:")
+            for problem in problems:
+                print(f"  {problem}")
+            sys.exit(1)
+        for name, url in pages.items():
+            results[name] = await _measure(client, url, requests, concurrency)
+            result = results[name]
+            print(
+                f"{name:40} p50 {result['p50_ms']:8.2f} мс  p95 {result['p95_ms']:8.2f} мс  "
+                f"p99 {result['p99_ms']:8.2f} мс  {result['rps']:8.1f} rps  "
+                f"SQL {result['statements']:3}  HTTP {result['status']}"
+            )
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Список регрессий относительно базовой линии"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result["p95_ms"] > reference["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']} мс (было {reference['p95_ms']} мс)")
+        if result["statements"] > reference["statements"]:
+            regressions.append(f"{name}: SQL-запросов {result['statements']} (было {reference['statements']})")
+        if result["status"] != reference["status"]:
+            regressions.append(f"{name}: HTTP {result['status']} (было {reference['status']})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк страниц админки")
+    parser.add_argument("--scale", type=float, default=0.01, help="Масштаб данных (1.0 = 1 млн заказов)")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора данных")
+    parser.add_argument("--requests", type=int, default=50, help="Запросов на страницу")
+    parser.add_argument("--concurrency", type=int, default=1, help="Одновременных запросов")
+    parser.add_argument("--database", help="Файл SQLite (по умолчанию временный)")
+    parser.add_argument("--save", help="Сохранить результаты как базовую линию JSON")
+    parser.add_argument("--baseline", help="Сравнить с базовой линией JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Допустимый рост p95 (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    # БД бенчмарка задается до импорта модулей приложения
+    database_path = args.database or os.path.join(tempfile.mkdtemp(prefix="bench_"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ.pop("SEED_DATA", None)
+
+    from database import get_db
+    from main import admin, app
+    from scipt import generate_data
+    from startup import bootstrap
+
+    generate_data(scale=args.scale, seed=args.seed)
+    bootstrap()
+    with get_db() as db:
+        _add_admin_orders(db, 45)
+        pages = _pages(admin, db)
+
+    results = asyncio.run(run(pages, app, admin, args.requests, args.concurrency))
+    report = {
+        "scale": args.scale,
+        "seed": args.seed,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "median_p95_ms": round(statistics.median(r["p95_ms"] for r in results.values()), 2),
+        "pages": results,
+    }
+
+    failures = over_budget(admin, results)
+    if failures:
+        print("❌ Превышен бюджет SQL-запросов:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as baseline_file:
+            json.dump(report, baseline_file, ensure_ascii=False, indent=2)
+        print(f"✅ Базовая линия сохранена в {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(results, baseline["pages"], args.tolerance)
+        if regressions:
+            print("❌ Регрессии производительности:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("✅ Регрессий нет")
+
+
+if __name__ == "__main__":
+    main()
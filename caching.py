@@ -0,0 +1,165 @@
+# caching.py
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import select
+from starlette.concurrency import run_in_threadpool
+
+from database import get_db
+from models import ModelVersion
+from versions import on_tables_committed, track_model_versions
+
+# Как часто (сек) сверять версии таблиц с БД, чтобы заметить изменения из других воркеров
+CACHE_VERSION_TTL = float(os.getenv("CACHE_VERSION_TTL", "2"))
+# Время жизни (сек) и размер кеша ответов автодополнения
+CACHE_AJAX_TTL = float(os.getenv("CACHE_AJAX_TTL", "30"))
+CACHE_AJAX_SIZE = int(os.getenv("CACHE_AJAX_SIZE", "512"))
+
+_CACHED_PATH = re.compile(r"^(?P<prefix>/[\w-]+)/(?P<identity>[\w-]+)/(?P<page>list|details/[^/]+|ajax/lookup)$")
+
+
+class TableVersions:
+    """
+    Версии данных таблиц (modelversion) в памяти процесса.
+
+    Все версии читаются одним запросом не чаще раза в CACHE_VERSION_TTL
+    секунд; коммит изменений в этом процессе сбрасывает их сразу.
+    """
+
+    def __init__(self):
+        self._versions = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_fresh(self):
+        return time.monotonic() - self._checked_at < CACHE_VERSION_TTL
+
+    def refresh(self):
+        with self._lock:
+            if self.is_fresh():
+                return
+            with get_db() as db:
+                rows = db.execute(select(ModelVersion.name, ModelVersion.version)).all()
+            self._versions = dict(rows)
+            self._checked_at = time.monotonic()
+
+    def get(self, tables):
+        """Кортеж версий таблиц в порядке tables"""
+        return tuple(self._versions.get(table, 0) for table in tables)
+
+    def invalidate(self, tables=None):
+        self._checked_at = 0.0
+
+
+table_versions = TableVersions()
+on_tables_committed(table_versions.invalidate)
+
+
+def track_view_tables(*views):
+    """Включает учет версий таблиц, от которых зависят страницы (cache_tables) и автодополнение разделов"""
+    for view in views:
+        track_model_versions(*getattr(view, "cache_tables", ()))
+        for ref in getattr(view, "form_ajax_refs", {}).values():
+            track_model_versions(ref["fields"][0].class_.__tablename__)
+
+
+class HttpCacheMiddleware:
+    """
+    ASGI-middleware условных GET-запросов к админке.
+
+    Для разделов с cache_tables страницы списка и просмотра получают ETag
+    из адреса и версий таблиц; если версия не менялась, браузер получает
+    304 без рендеринга и запросов к БД. Ответы автодополнения (ajax/lookup)
+    хранятся в памяти CACHE_AJAX_TTL секунд до изменения целевой таблицы.
+    """
+
+    def __init__(self, app, admin):
+        self.app = app
+        self.admin = admin
+        self._views = None
+        self._ajax = OrderedDict()
+        self._ajax_lock = threading.Lock()
+
+    def _view(self, identity):
+        if self._views is None:
+            self._views = {
+                view.identity: view for view in self.admin.views if hasattr(view, "identity")
+            }
+        return self._views.get(identity)
+
+    def _tables(self, view, page, scope):
+        """Таблицы, от которых зависит ответ, или None, если ответ не кешируется"""
+        if page == "ajax/lookup":
+            query = dict(
+                pair.split("=", 1) for pair in scope["query_string"].decode().split("&") if "=" in pair
+            )
+            loader = getattr(view, "_form_ajax_refs", {}).get(query.get("name"))
+            return (loader.model.__tablename__,) if loader is not None else None
+        return getattr(view, "cache_tables", None)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+        match = _CACHED_PATH.match(scope["path"])
+        view = match and match["prefix"] == self.admin.base_url and self._view(match["identity"])
+        tables = view and self._tables(view, match["page"], scope)
+        if not tables:
+            await self.app(scope, receive, send)
+            return
+
+        if not table_versions.is_fresh():
+            await run_in_threadpool(table_versions.refresh)
+        versions = table_versions.get(tables)
+        key = f"{scope['path']}?{scope['query_string'].decode()}"
+
+        if match["page"] == "ajax/lookup":
+            await self._ajax_lookup(scope, receive, send, (key, versions))
+            return
+
+        digest = hashlib.sha1(f"{key}|{tables}|{versions}".encode()).hexdigest()[:24]
+        etag = f'W/"{digest}"'.encode()
+        cache_headers = [(b"etag", etag), (b"cache-control", b"private, no-cache")]
+        request_headers = dict(scope["headers"])
+        if etag in request_headers.get(b"if-none-match", b"").split(b", "):
+            await send({"type": "http.response.start", "status": 304, "headers": cache_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                message["headers"] = list(message.get("headers", [])) + cache_headers
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _ajax_lookup(self, scope, receive, send, cache_key):
+        with self._ajax_lock:
+            cached = self._ajax.get(cache_key)
+        if cached is not None and time.monotonic() - cached[0] < CACHE_AJAX_TTL:
+            await send({"type": "http.response.start", "status": 200, "headers": cached[1]})
+            await send({"type": "http.response.body", "body": cached[2]})
+            return
+
+        start = None
+        body = []
+
+        async def send_wrapper(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+            elif start["status"] == 200:
+                body.append(message.get("body", b""))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if start is not None and start["status"] == 200:
+            with self._ajax_lock:
+                self._ajax[cache_key] = (time.monotonic(), start.get("headers", []), b"".join(body))
+                self._ajax.move_to_end(cache_key)
+                while len(self._ajax) > CACHE_AJAX_SIZE:
+                    self._ajax.popitem(last=False)
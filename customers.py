@@ -0,0 +1,162 @@
+# customers.py
+"""
+Нормализованные контакты клиентов и объединение дублей.
+
+    python customers.py backfill             заполнить phone_normalized / email_normalized
+    python customers.py dedup                показать группы вероятных дублей
+    python customers.py dedup --merge 12,57 40,41,93
+                                             объединить проверенные группы (id клиентов группы через запятую)
+"""
+import argparse
+import time
+
+from sqlalchemy import bindparam, select, update
+
+from database import engine
+from models import ArchivedOrder, Customer, Order, normalize_email, normalize_phone
+from versions import bump_model_version
+
+# Клиентов в одной пачке чтения и записи
+CUSTOMER_BATCH_SIZE = 5000
+# Групп дублей в одной транзакции объединения
+MERGE_BATCH_SIZE = 500
+
+
+def backfill_normalized_contacts(conn):
+    """Заполняет нормализованные контакты клиентов, у которых их еще нет"""
+    customers = Customer.__table__
+    stmt = (
+        update(customers)
+        .where(customers.c.id == bindparam("customer_id"))
+        .values(phone_normalized=bindparam("phone_value"), email_normalized=bindparam("email_value"))
+    )
+    updated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            select(customers.c.id, customers.c.phone, customers.c.email)
+            .where(customers.c.phone_normalized.is_(None), customers.c.id > last_id)
+            .order_by(customers.c.id)
+            .limit(CUSTOMER_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return updated
+        conn.execute(stmt, [
+            {"customer_id": row.id, "phone_value": normalize_phone(row.phone), "email_value": normalize_email(row.email)}
+            for row in rows
+        ])
+        updated += len(rows)
+        last_id = rows[-1].id
+
+
+def _duplicate_key(phone, email, full_name):
+    """
+    Ключ дубля: телефон вместе с email, а без email — телефон вместе с ФИО.
+    Один общий контакт (телефон офиса, email-заглушка) клиентов не объединяет.
+    """
+    if phone is None:
+        return None
+    if email is not None:
+        return ("email", phone, email)
+    return ("name", phone, " ".join(full_name.lower().split()))
+
+
+def find_duplicates():
+    """
+    Группы вероятных дублей: клиенты с одинаковым ключом (см. _duplicate_key).
+
+    Один проход по таблице, ключи — в словаре; группы не сцепляются через
+    общие контакты, каждый клиент попадает не больше чем в одну группу.
+    Возвращает списки id по возрастанию, первым идет старший клиент —
+    его id служит id группы.
+    """
+    groups = {}
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=CUSTOMER_BATCH_SIZE).execute(
+            select(Customer.id, Customer.phone_normalized, Customer.email_normalized, Customer.full_name)
+            .order_by(Customer.id)
+        )
+        for customer_id, phone, email, full_name in result:
+            key = _duplicate_key(phone, email, full_name)
+            if key is not None:
+                groups.setdefault(key, []).append(customer_id)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def describe_groups(groups):
+    """Группы с данными клиентов для проверки: [{"id", "customers": [{id, full_name, phone, email}]}]"""
+    ids = [customer_id for group in groups for customer_id in group]
+    customers = {}
+    with engine.connect() as conn:
+        for start in range(0, len(ids), CUSTOMER_BATCH_SIZE):
+            for row in conn.execute(
+                select(Customer.id, Customer.full_name, Customer.phone, Customer.email)
+                .where(Customer.id.in_(ids[start:start + CUSTOMER_BATCH_SIZE]))
+            ).mappings():
+                customers[row["id"]] = dict(row)
+    return [
+        {"id": group[0], "customers": [customers[customer_id] for customer_id in group if customer_id in customers]}
+        for group in groups
+    ]
+
+
+def select_groups(groups, reviewed):
+    """
+    Только проверенные группы: reviewed — списки id клиентов, которые видел
+    оператор. Группа объединяется, только если ее состав не изменился:
+    клиент, ставший дублем после проверки, или клиент, переставший им быть,
+    исключают всю группу.
+    """
+    reviewed = {frozenset(members) for members in reviewed}
+    return [group for group in groups if frozenset(group) in reviewed]
+
+
+def merge_duplicates(groups):
+    """
+    Переносит заказы (и архивные) на старшего клиента группы и удаляет остальных.
+    Удаление необратимо: передавайте только проверенные группы (см. select_groups).
+    """
+    merged = 0
+    for start in range(0, len(groups), MERGE_BATCH_SIZE):
+        with engine.begin() as conn:
+            for survivor, *duplicates in groups[start:start + MERGE_BATCH_SIZE]:
+                for model in (Order, ArchivedOrder):
+                    table = model.__table__
+                    conn.execute(
+                        update(table).where(table.c.customer_id.in_(duplicates)).values(customer_id=survivor)
+                    )
+                conn.execute(Customer.__table__.delete().where(Customer.__table__.c.id.in_(duplicates)))
+                merged += len(duplicates)
+            # Удаление мимо ORM: кеши справочника клиентов должны обновиться
+            bump_model_version(conn, Customer.__tablename__)
+    return merged
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Контакты и дубли клиентов")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("backfill", help="Заполнить нормализованные телефон и email")
+    dedup_parser = commands.add_parser("dedup", help="Показать или объединить дубли клиентов")
+    dedup_parser.add_argument("--merge", nargs="+", metavar="ID,ID,...",
+                              type=lambda members: [int(member) for member in members.split(",")],
+                              help="Объединить проверенные группы: id всех клиентов группы через запятую")
+    args = parser.parse_args()
+    started = time.perf_counter()
+
+    if args.command == "backfill":
+        with engine.begin() as conn:
+            count = backfill_normalized_contacts(conn)
+        print(f"✅ Контакты нормализованы у {count} клиентов за {time.perf_counter() - started:.1f} с")
+    elif not args.merge:
+        groups = find_duplicates()
+        for group in describe_groups(groups[:50]):
+            print(f"Группа {group['id']}:")
+            for customer in group["customers"]:
+                print(f"    {customer['id']}: {customer['full_name']}, {customer['phone']}, {customer['email'] or '—'}")
+        print(f"Групп дублей: {len(groups)}, лишних клиентов: {sum(len(group) - 1 for group in groups)}")
+    else:
+        groups = select_groups(find_duplicates(), args.merge)
+        merged = merge_duplicates(groups)
+        print(f"✅ Объединено клиентов: {merged} в {len(groups)} группах за {time.perf_counter() - started:.1f} с")
+        if len(groups) < len(args.merge):
+            print(f"Пропущено групп, состав которых изменился: {len(args.merge) - len(groups)}")
@@ -1,17 +1,215 @@
 # database.py
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from contextlib import contextmanager
+import os
 
-DATABASE_URL = "sqlite:///./test.db"
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import Select
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+
+# Асинхронные драйверы для соответствующих синхронных URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def _async_url(url):
+    """Возвращает URL с асинхронным драйвером (aiosqlite, asyncpg)"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Нет асинхронного драйвера для {backend}")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+# Админка работает через асинхронные сессии, если DB_ASYNC=1
+ASYNC_MODE = os.getenv("DB_ASYNC") == "1"
+
+# Асинхронный движок создается, только если он нужен: DB_ASYNC=1 или задан ASYNC_DATABASE_URL
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or (_async_url(DATABASE_URL) if ASYNC_MODE else None)
+
+# Реплика для чтения: списки и поиск админки идут на нее, запись — на основную БД
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")
+
+# Настройки пула соединений
+POOL_OPTIONS = {
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": True,
+}
+# Размер пула: только для QueuePool (у SQLite в памяти пул другой и этих параметров нет)
+QUEUE_POOL_OPTIONS = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+}
+
+# Профиль SQLite: WAL (читатели не блокируют писателя), ожидание блокировки
+# вместо «database is locked» и внешние ключи, на которых держатся правила ondelete
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536")),
+    "foreign_keys": "ON",
+    "temp_store": "MEMORY",
+}
+
+# Ограничение времени запроса в PostgreSQL, мс (0 — без ограничения)
+PG_STATEMENT_TIMEOUT_MS = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "0"))
 
 Base = declarative_base()
 
-engine = create_engine(
-    DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Увеличивается при каждом изменении моделей (см. startup.upgrade_schema)
+SCHEMA_VERSION = 10
+
+
+def _engine_options(url, is_async=False):
+    """Параметры create_engine для выбранной БД"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    options = dict(POOL_OPTIONS)
+    if issubclass(url.get_dialect(_is_async=is_async).get_pool_class(url), QueuePool):
+        options.update(QUEUE_POOL_OPTIONS)
+    if backend == "sqlite":
+        if not is_async:
+            options["connect_args"] = {"check_same_thread": False}
+    elif backend == "postgresql":
+        # LIFO держит горячими немногие соединения, лишние закрываются по pool_recycle
+        options["pool_use_lifo"] = True
+        if PG_STATEMENT_TIMEOUT_MS:
+            if is_async:
+                options["connect_args"] = {"server_settings": {"statement_timeout": str(PG_STATEMENT_TIMEOUT_MS)}}
+            else:
+                options["connect_args"] = {"options": f"-c statement_timeout={PG_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def _create_engines(url, async_url):
+    """Синхронный и (если задан async_url) асинхронный движки одной БД с профилем настроек"""
+    sync_engine = create_engine(url, **_engine_options(url))
+    async_engine = None
+    if async_url is not None:
+        async_engine = create_async_engine(async_url, **_engine_options(async_url, is_async=True))
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", _apply_sqlite_pragmas)
+        if async_engine is not None:
+            event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return sync_engine, async_engine
+
+
+engine, async_engine = _create_engines(DATABASE_URL, ASYNC_DATABASE_URL)
+
+if DATABASE_REPLICA_URL:
+    replica_engine, async_replica_engine = _create_engines(
+        DATABASE_REPLICA_URL,
+        os.getenv("ASYNC_DATABASE_REPLICA_URL") or (_async_url(DATABASE_REPLICA_URL) if async_engine else None),
+    )
+else:
+    replica_engine = async_replica_engine = None
+
+
+class RoutingSession(Session):
+    """
+    Сессия, читающая с реплики.
+
+    SELECT без FOR UPDATE выполняются на реплике, пока сессия ничего не
+    записала; запись и все последующие запросы сессии идут на основную БД,
+    чтобы видеть собственные изменения.
+    """
+
+    primary = engine
+    replica = replica_engine
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.replica is None or self.info.get("use_primary"):
+            return self.primary
+        if self._flushing or (clause is not None and not isinstance(clause, Select)):
+            self.info["use_primary"] = True
+            return self.primary
+        if isinstance(clause, Select) and clause._for_update_arg is None:
+            return self.replica
+        return self.primary
+
+
+class AsyncRoutingSession(RoutingSession):
+    """Синхронная часть AsyncSession с той же маршрутизацией"""
+
+    primary = async_engine.sync_engine if async_engine is not None else None
+    replica = async_replica_engine.sync_engine if async_replica_engine is not None else None
+
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, class_=RoutingSession)
+
+# Без асинхронного движка (DB_ASYNC не задан) асинхронных сессий нет
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    sync_session_class=AsyncRoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+) if async_engine is not None else None
+
+# Счетчик SQL-запросов текущего контекста (см. count_queries)
+_query_counter: ContextVar = ContextVar("query_counter", default=None)
+
+
+class QueryCounter:
+    """Количество SQL-запросов, выполненных внутри count_queries()"""
+
+    def __init__(self, parent=None):
+        self.count = 0
+        # Внешний счетчик: вложенные count_queries() учитываются и в нем
+        self.parent = parent
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _query_counter.get()
+    while counter is not None:
+        counter.count += 1
+        counter = counter.parent
+
+
+# Все движки приложения (основная БД и реплика, синхронные и асинхронные)
+ENGINES = [e for e in (engine, async_engine, replica_engine, async_replica_engine) if e is not None]
+
+for _engine in ENGINES:
+    event.listen(getattr(_engine, "sync_engine", _engine), "before_cursor_execute", _count_query)
+
+
+@contextmanager
+def count_queries():
+    """
+    Считает SQL-запросы, выполненные в текущем контексте.
+    Используется для контроля бюджета запросов страниц админки.
+    
+    Пример использования:
+    with count_queries() as counter:
+        db.query(Order).all()
+    print(counter.count)
+    """
+    counter = QueryCounter(_query_counter.get())
+    token = _query_counter.set(counter)
+    try:
+        yield counter
+    finally:
+        _query_counter.reset(token)
+
 
 @contextmanager
 def get_db():
@@ -29,6 +227,36 @@ def get_db():
     finally:
         db.close()
 
+
+@asynccontextmanager
+async def get_async_db():
+    """
+    Асинхронный вариант get_db (при DB_ASYNC=1 или заданном ASYNC_DATABASE_URL).
+    
+    Пример использования:
+    async with get_async_db() as db:
+        result = await db.execute(select(User))
+    """
+    if AsyncSessionLocal is None:
+        raise RuntimeError(
+            "Асинхронный движок не создан: задайте DB_ASYNC=1 или ASYNC_DATABASE_URL"
+        )
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def utcnow():
+    """Текущее время UTC без часового пояса — в таком виде даты хранит БД (CURRENT_TIMESTAMP)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def upsert_insert(model, dialect_name):
+    """INSERT с поддержкой ON CONFLICT для текущей БД (SQLite или PostgreSQL)"""
+    if dialect_name == "postgresql":
+        return postgresql_insert(model)
+    return sqlite_insert(model)
+
+
 def create_tables():
     """Создает все таблицы в базе данных на основе зарегистрированных моделей"""
     # Импорт моделей необходим для их регистрации в декларативной базе Base
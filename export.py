@@ -0,0 +1,222 @@
+# export.py
+import csv
+import io
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import String, cast, func, literal, select, union_all
+
+from database import engine
+from models import (
+    ArchivedOrder, ArchivedOrderTruck, Customer, Order, OrderTruck, ProductType, Quarry, TruckType,
+)
+
+# Строк в одной порции чтения курсора и записи в поток
+EXPORT_CHUNK_SIZE = 5000
+
+EXPORT_COLUMNS = [
+    "id", "created_at", "status", "customer", "phone", "product", "quarry",
+    "quantity", "price_per_unit", "total_price", "delivery_address",
+    "truck_count", "fleet_volume", "trucks_summary",
+]
+
+
+def _truck_columns(order_model, truck_model):
+    """
+    Сводка машин заказа, посчитанная в SQL коррелированными подзапросами.
+    Каждый подзапрос — поиск по индексу order_id таблицы машин, поэтому строки
+    выдаются сразу, без предварительной группировки всей таблицы машин.
+    """
+    def per_order(stmt):
+        return (
+            stmt.select_from(truck_model)
+            .join(TruckType, TruckType.id == truck_model.truck_type_id)
+            .where(truck_model.order_id == order_model.id)
+            .scalar_subquery()
+        )
+
+    label = TruckType.name + literal(" × ") + cast(truck_model.count, String)
+    if engine.dialect.name == "postgresql":
+        summary = func.string_agg(label, literal(", "))
+    else:
+        summary = func.group_concat(label, ", ")
+    return [
+        func.coalesce(per_order(select(func.sum(truck_model.count))), 0).label("truck_count"),
+        func.coalesce(per_order(select(func.sum(truck_model.count * TruckType.volume))), 0).label("fleet_volume"),
+        per_order(select(summary)).label("trucks_summary"),
+    ]
+
+
+def _orders_select(order_model, truck_model, order_ids, status):
+    stmt = (
+        select(
+            order_model.id,
+            order_model.created_at,
+            order_model.status,
+            Customer.full_name.label("customer"),
+            Customer.phone,
+            ProductType.name.label("product"),
+            Quarry.name.label("quarry"),
+            order_model.quantity,
+            order_model.price_per_unit,
+            order_model.total_price,
+            order_model.delivery_address,
+            *_truck_columns(order_model, truck_model),
+        )
+        .outerjoin(Customer, Customer.id == order_model.customer_id)
+        .join(ProductType, ProductType.id == order_model.product_id)
+        .join(Quarry, Quarry.id == order_model.quarry_id)
+    )
+    if order_ids:
+        stmt = stmt.where(order_model.id.in_(order_ids))
+    if status:
+        stmt = stmt.where(order_model.status == status)
+    return stmt
+
+
+def export_query(order_ids=None, status=None, include_archived=True):
+    """
+    Плоский Core-запрос выгрузки заказов без загрузки ORM-объектов;
+    с include_archived в выгрузку входят и заказы, перенесенные в архив.
+    """
+    live = _orders_select(Order, OrderTruck, order_ids, status)
+    if not include_archived:
+        return live.order_by(Order.id)
+    orders = union_all(live, _orders_select(ArchivedOrder, ArchivedOrderTruck, order_ids, status)).subquery()
+    return select(orders).order_by(orders.c.id)
+
+
+def iter_order_chunks(stmt):
+    """Порции строк через серверный курсор: в памяти не больше EXPORT_CHUNK_SIZE строк"""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE).execute(stmt)
+        for rows in result.partitions():
+            yield rows
+
+
+def stream_csv(stmt):
+    # BOM, чтобы Excel правильно открыл кириллицу
+    yield "\ufeff" + ";".join(EXPORT_COLUMNS) + "\r\n"
+    for rows in iter_order_chunks(stmt):
+        buffer = io.StringIO()
+        csv.writer(buffer, delimiter=";").writerows(rows)
+        yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Файлоподобный приемник: отдает накопленные байты Parquet по мере записи"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_parquet(stmt):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Для выгрузки в Parquet установите pyarrow")
+
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("created_at", pa.timestamp("s")),
+        ("status", pa.string()),
+        ("customer", pa.string()),
+        ("phone", pa.string()),
+        ("product", pa.string()),
+        ("quarry", pa.string()),
+        ("quantity", pa.float64()),
+        ("price_per_unit", pa.float64()),
+        ("total_price", pa.float64()),
+        ("delivery_address", pa.string()),
+        ("truck_count", pa.int64()),
+        ("fleet_volume", pa.float64()),
+        ("trucks_summary", pa.string()),
+    ])
+
+    def generate():
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema)
+        for rows in iter_order_chunks(stmt):
+            columns = list(zip(*rows))
+            arrays = [
+                pa.array(
+                    [float(value) if value is not None and field.type == pa.float64() else value for value in column],
+                    type=field.type,
+                )
+                for field, column in zip(schema, columns)
+            ]
+            # Каждая порция — отдельная row group, сразу уходит клиенту
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+    return generate()
+
+
+router = APIRouter(prefix="/api/export", tags=["export"])
+
+
+def _parse_ids(ids):
+    try:
+        return [int(pk) for pk in ids.split(",") if pk] if ids else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ids должен быть списком чисел через запятую")
+
+
+def _filename(extension):
+    return f"orders_{datetime.now():%Y%m%d_%H%M%S}.{extension}"
+
+
+@router.get("/orders.csv")
+def export_orders_csv(
+    ids: str = Query(None, description="id заказов через запятую"),
+    status: str = Query(None, description="Статус заказа"),
+    include_archived: bool = Query(True, description="Включить заказы из архива"),
+):
+    """Потоковая выгрузка заказов в CSV"""
+    stmt = export_query(_parse_ids(ids), status, include_archived)
+    return StreamingResponse(
+        stream_csv(stmt),
+        media_type="text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{_filename("csv")}"'},
+    )
+
+
+@router.get("/orders.parquet")
+def export_orders_parquet(
+    ids: str = Query(None, description="id заказов через запятую"),
+    status: str = Query(None, description="Статус заказа"),
+    include_archived: bool = Query(True, description="Включить заказы из архива"),
+):
+    """Потоковая выгрузка заказов в Parquet (нужен pyarrow)"""
+    stmt = export_query(_parse_ids(ids), status, include_archived)
+    return StreamingResponse(
+        stream_parquet(stmt),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f'attachment; filename="{_filename("parquet")}"'},
+    )
@@ -0,0 +1,422 @@
+# jobs.py
+"""
+Фоновые задачи.
+
+Задача регистрируется декоратором @job, ставится в очередь через
+runner.enqueue() и выполняется в пуле потоков (задачи с вводом-выводом)
+или процессов (задачи, нагружающие CPU). Состояние, ход выполнения и
+результат хранятся в таблице job, поэтому их видит любой воркер:
+
+    GET /api/jobs/{id}          состояние и прогресс
+    GET /api/jobs/{id}/result   результат завершенной задачи
+"""
+import inspect
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from fastapi import APIRouter, Body, HTTPException
+from sqlalchemy import insert, select, update
+from sqlalchemy.orm import lazyload
+
+from archive import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, archive_orders, count_archivable
+from customers import describe_groups, find_duplicates, merge_duplicates, select_groups
+from database import engine, get_db, utcnow
+from models import OPEN_STATUSES, ORDER_STATUSES, Job, Order, QuarryProductPrice
+from pricing import reprice_open_orders
+from trucks import assign_trucks, load_planner
+
+logger = logging.getLogger(__name__)
+
+# Размеры пулов: потоки для задач с вводом-выводом, процессы для вычислений
+JOB_THREADS = int(os.getenv("JOB_THREADS", "4"))
+JOB_PROCESSES = int(os.getenv("JOB_PROCESSES", "2"))
+# Заказов в одной транзакции массовых задач
+JOB_BATCH_SIZE = 1000
+# Сколько групп дублей клиентов показывать для проверки
+DEDUP_REVIEW_LIMIT = 200
+
+# Задача: имя -> (функция, "thread" или "process")
+_registry = {}
+# Параметры задач для POST /api/jobs/{name}:
+# имя -> (допустимые параметры, обязательные, проверка значений или None)
+_http_params = {}
+
+
+def job(name, kind="thread", validate=None):
+    """
+    Регистрирует функцию f(progress, **params) как фоновую задачу name.
+    validate(params) проверяет значения параметров из API и бросает ValueError.
+    """
+    def register(func):
+        _registry[name] = (func, kind)
+        params = list(inspect.signature(func).parameters.values())[1:]
+        _http_params[name] = (
+            {param.name for param in params},
+            {param.name for param in params if param.default is inspect.Parameter.empty},
+            validate,
+        )
+        return func
+    return register
+
+
+def _check_ids(params, name):
+    """Параметр name, если задан, — список целых id"""
+    ids = params.get(name)
+    if ids is None:
+        return
+    # bool — подкласс int, но id им не бывает
+    if not isinstance(ids, list) or not all(type(item) is int for item in ids):
+        raise ValueError(f"{name}: нужен список целых id")
+
+
+def _check_id_groups(params, name):
+    """Параметр name, если задан, — список групп, каждая — список не меньше двух целых id"""
+    groups = params.get(name)
+    if groups is None:
+        return
+    if not isinstance(groups, list) or not all(
+        isinstance(group, list) and len(group) > 1 and all(type(item) is int for item in group)
+        for group in groups
+    ):
+        raise ValueError(f"{name}: нужен список групп из целых id клиентов")
+
+
+def _check_positive(params, *names):
+    """Параметры names, если переданы, — целые числа больше нуля"""
+    for name in names:
+        if name not in params:
+            continue
+        value = params[name]
+        if type(value) is not int or value < 1:
+            raise ValueError(f"{name}: нужно целое число больше 0")
+
+
+def _validate_set_status(params):
+    if params["order_ids"] is None:
+        raise ValueError("order_ids: нужен список целых id")
+    _check_ids(params, "order_ids")
+    _check_positive(params, "batch_size")
+    if params["status"] not in ORDER_STATUSES:
+        raise ValueError(f"status: допустимые значения {', '.join(ORDER_STATUSES)}")
+
+
+def _update(job_id, **values):
+    with engine.begin() as conn:
+        conn.execute(update(Job.__table__).where(Job.__table__.c.id == job_id).values(**values))
+
+
+class JobProgress:
+    """Передается в задачу: progress(доля, сообщение) сохраняет ход выполнения"""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+
+    def __call__(self, fraction=None, message=None):
+        values = {}
+        if fraction is not None:
+            values["progress"] = min(max(fraction, 0.0), 1.0)
+        if message is not None:
+            values["message"] = message[:255]
+        if values:
+            _update(self.job_id, **values)
+
+
+def _execute(job_id, name, params):
+    """Выполняет задачу в потоке или процессе пула и сохраняет результат"""
+    func, _ = _registry[name]
+    _update(job_id, status="running", started_at=utcnow())
+    try:
+        result = func(JobProgress(job_id), **params)
+    except Exception as e:
+        logger.exception("Задача %s (%s) завершилась ошибкой", name, job_id)
+        _update(job_id, status="failed", error=f"{type(e).__name__}: {e}", finished_at=utcnow())
+    else:
+        _update(
+            job_id, status="done", progress=1.0, finished_at=utcnow(),
+            result=json.dumps(result, ensure_ascii=False, default=str),
+        )
+
+
+def _on_done(job_id, future):
+    # Ошибки самой задачи сохраняет _execute; здесь — отмена и падение процесса пула
+    if future.cancelled():
+        _update(job_id, status="failed", error="Отменена при остановке приложения", finished_at=utcnow())
+    elif future.exception() is not None:
+        _update(job_id, status="failed", error=repr(future.exception()), finished_at=utcnow())
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _worker_alive(worker):
+    """Жив ли процесс-воркер worker; о воркерах других хостов судить нельзя — считаются живыми"""
+    host, _, pid = (worker or "").rpartition(":")
+    if not pid.isdigit():
+        return False
+    if host != socket.gethostname():
+        return True
+    if int(pid) == os.getpid():
+        # Пулы этого процесса только создаются: запись осталась от прежнего процесса с тем же pid
+        return False
+    if os.name == "nt":
+        # os.kill в Windows завершает процесс, проверить его так нельзя
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fail_orphaned_jobs():
+    """
+    Помечает ошибкой задачи, оставшиеся в очереди или в работе от завершившихся
+    воркеров: их пулы пропали вместе с процессом. Возвращает число таких задач.
+    """
+    with engine.begin() as conn:
+        rows = conn.execute(select(Job.id, Job.worker).where(Job.status.in_(("queued", "running")))).all()
+        orphaned = [job_id for job_id, worker in rows if not _worker_alive(worker)]
+        if orphaned:
+            conn.execute(update(Job.__table__).where(Job.__table__.c.id.in_(orphaned)).values(
+                status="failed", error="Воркер остановился до завершения задачи", finished_at=utcnow(),
+            ))
+    if orphaned:
+        logger.warning("Задачи завершившихся воркеров помечены ошибкой: %s", len(orphaned))
+    return len(orphaned)
+
+
+class JobRunner:
+    """Пулы потоков и процессов для фоновых задач; запускается из lifespan приложения"""
+
+    def __init__(self, threads=JOB_THREADS, processes=JOB_PROCESSES):
+        self.threads = threads
+        self.processes = processes
+        self._thread_pool = None
+        self._process_pool = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread_pool is not None:
+                return
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="job")
+            self._process_pool = self._new_process_pool()
+            fail_orphaned_jobs()
+
+    def _new_process_pool(self):
+        if not self.processes:
+            return None
+        # spawn: дочерний процесс не наследует соединения и потоки воркера
+        return ProcessPoolExecutor(max_workers=self.processes, mp_context=multiprocessing.get_context("spawn"))
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            for pool in (self._thread_pool, self._process_pool):
+                if pool is not None:
+                    pool.shutdown(wait=wait, cancel_futures=True)
+            self._thread_pool = self._process_pool = None
+
+    def enqueue(self, name, **params):
+        """Ставит задачу в очередь и сразу возвращает ее id"""
+        if name not in _registry:
+            raise ValueError(f"Неизвестная задача: {name}")
+        self.start()
+        job_id = uuid.uuid4().hex
+        with engine.begin() as conn:
+            conn.execute(insert(Job.__table__).values(
+                id=job_id, name=name, status="queued", progress=0.0, worker=_worker_id(),
+                params=json.dumps(params, ensure_ascii=False),
+            ))
+        _, kind = _registry[name]
+        if kind == "process" and self._process_pool is not None:
+            try:
+                future = self._process_pool.submit(_execute, job_id, name, params)
+            except BrokenProcessPool:
+                # Процесс пула аварийно завершился: пул непригоден, создаем новый
+                with self._lock:
+                    self._process_pool = self._new_process_pool()
+                future = self._process_pool.submit(_execute, job_id, name, params)
+        else:
+            future = self._thread_pool.submit(_execute, job_id, name, params)
+        future.add_done_callback(lambda future: _on_done(job_id, future))
+        return job_id
+
+
+runner = JobRunner()
+
+
+@job("set_status", validate=_validate_set_status)
+def set_orders_status(progress, order_ids, status, batch_size=JOB_BATCH_SIZE):
+    """Массовая смена статуса через ORM: агрегаты продаж обновляются событиями"""
+    done = 0
+    for start in range(0, len(order_ids), batch_size):
+        chunk = order_ids[start:start + batch_size]
+        with get_db() as db:
+            orders = db.execute(
+                select(Order)
+                .options(lazyload("*"))
+                .where(Order.id.in_(chunk))
+            ).scalars()
+            for order in orders:
+                order.status = status
+            db.commit()
+        done += len(chunk)
+        progress(done / len(order_ids), f"Обработано {done} из {len(order_ids)}")
+    return {"count": done}
+
+
+def _validate_plan_trucks(params):
+    _check_ids(params, "order_ids")
+    _check_positive(params, "batch_size")
+
+
+@job("plan_trucks", kind="process", validate=_validate_plan_trucks)
+def plan_trucks(progress, order_ids=None, batch_size=JOB_BATCH_SIZE):
+    """
+    Подбор машин для открытых заказов order_ids (по умолчанию — всех открытых).
+    Закрытые заказы и заказы больше PLAN_MAX_QUANTITY попадают в skipped.
+    """
+    with get_db() as db:
+        planner = load_planner(db)
+        if order_ids is None:
+            order_ids = db.execute(
+                select(Order.id).where(Order.status.in_(OPEN_STATUSES)).order_by(Order.id)
+            ).scalars().all()
+        processed = 0
+        for start in range(0, len(order_ids), batch_size):
+            processed += assign_trucks(db, order_ids[start:start + batch_size], planner)
+            db.commit()
+            progress(min(start + batch_size, len(order_ids)) / len(order_ids), f"Обработано заказов: {processed}")
+    return {"count": processed, "skipped": len(order_ids) - processed}
+
+
+@job("reprice", validate=lambda params: _check_ids(params, "price_ids"))
+def reprice(progress, price_ids=None, quarry_id=None, product_id=None, reason=None):
+    """Пересчет открытых заказов по текущим ценам (выбранным price_ids или по карьеру/товару)"""
+    pairs = None
+    if price_ids is not None:
+        with get_db() as db:
+            pairs = [tuple(pair) for pair in db.execute(
+                select(QuarryProductPrice.quarry_id, QuarryProductPrice.product_id)
+                .where(QuarryProductPrice.id.in_(price_ids))
+            )]
+        if not pairs:
+            return {"count": 0}
+    progress(None, "Пересчет заказов")
+    return reprice_open_orders(pairs=pairs, quarry_id=quarry_id, product_id=product_id, reason=reason)
+
+
+@job("archive", validate=lambda params: _check_positive(params, "days", "batch_size"))
+def archive(progress, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """Перенос закрытых заказов в архив"""
+    total = count_archivable(days)
+
+    def on_batch(archived):
+        progress(archived / total if total else None, f"Перенесено {archived} из {total}")
+
+    return {"archived": archive_orders(days, batch_size, on_batch=on_batch)}
+
+
+@job("dedup_customers", kind="process", validate=lambda params: _check_id_groups(params, "groups"))
+def dedup_customers(progress, dry_run=True, groups=None):
+    """
+    Дубли клиентов по нормализованным телефону и email. По умолчанию только
+    поиск: результат — группы для проверки. Объединяются лишь группы
+    groups (списки id клиентов, которые видел оператор), если при запуске
+    их состав не изменился.
+    """
+    progress(None, "Поиск дублей")
+    found = find_duplicates()
+    if dry_run:
+        return {"groups": len(found), "items": describe_groups(found[:DEDUP_REVIEW_LIMIT])}
+    reviewed = groups or []
+    selected = select_groups(found, reviewed)
+    progress(0.5, f"Объединение групп: {len(selected)}")
+    return {
+        "groups": len(selected),
+        "merged": merge_duplicates(selected),
+        # Группы, состав которых изменился после проверки, не объединяются
+        "skipped": len(reviewed) - len(selected),
+    }
+
+
+def job_info(job_id):
+    """Состояние задачи без результата или None"""
+    with engine.connect() as conn:
+        row = conn.execute(
+            select(
+                Job.id, Job.name, Job.status, Job.progress, Job.message, Job.error,
+                Job.created_at, Job.started_at, Job.finished_at,
+            ).where(Job.id == job_id)
+        ).mappings().first()
+    return dict(row) if row is not None else None
+
+
+def job_result(job_id):
+    """(status, error, результат) задачи или None, если задачи нет"""
+    with engine.connect() as conn:
+        row = conn.execute(select(Job.status, Job.result, Job.error).where(Job.id == job_id)).first()
+    if row is None:
+        return None
+    return row.status, row.error, json.loads(row.result) if row.result else None
+
+
+def recent_jobs(limit=50):
+    with engine.connect() as conn:
+        return conn.execute(
+            select(Job.id, Job.name, Job.status, Job.progress, Job.message, Job.error, Job.created_at, Job.finished_at)
+            .order_by(Job.created_at.desc())
+            .limit(limit)
+        ).mappings().all()
+
+
+router = APIRouter(prefix="/api/jobs", tags=["jobs"])
+
+
+@router.post("/{name}", status_code=202)
+def enqueue_job(name: str, params: dict = Body(default={})):
+    """Ставит задачу в очередь; параметры — JSON-объект с параметрами функции задачи"""
+    if name not in _http_params:
+        raise HTTPException(status_code=404, detail="Неизвестная задача")
+    allowed, required, validate = _http_params[name]
+    unknown = sorted(set(params) - allowed)
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Неизвестные параметры: {', '.join(unknown)}")
+    missing = sorted(required - set(params))
+    if missing:
+        raise HTTPException(status_code=422, detail=f"Не заданы параметры: {', '.join(missing)}")
+    if validate is not None:
+        try:
+            validate(params)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+    return {"id": runner.enqueue(name, **params)}
+
+
+@router.get("/{job_id}")
+def get_job(job_id: str):
+    info = job_info(job_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return info
+
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str):
+    row = job_result(job_id)
+    if row is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    status, error, result = row
+    if status != "done":
+        raise HTTPException(status_code=409, detail={"status": status, "error": error})
+    return result
@@ -1,6 +1,8 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from sqladmin import Admin
-from database import engine, create_tables
+from database import ASYNC_MODE, ENGINES, AsyncSessionLocal, SessionLocal
 from admin import (
     ProductCategoryAdmin,
     ProductTypeAdmin,
@@ -8,23 +10,50 @@ from admin import (
     QuarryProductPriceAdmin,
     CustomerAdmin,
     OrderAdmin,
+    ArchivedOrderAdmin,
+    JobsAdmin,
+    SalesDashboardAdmin,
     TruckTypeAdmin  # Добавляем новую админку
 )
-from scipt import seed_data
+from api import router as api_router
+from caching import HttpCacheMiddleware
+from export import router as export_router
+from jobs import router as jobs_router, runner
+from metrics import MetricsMiddleware, instrument_engine, metrics_endpoint
+from pricing import router as pricing_router
+from startup import bootstrap
+from trucks import router as trucks_router
+
 
-# Создаем таблицы в БД
-create_tables()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Проверка схемы и (по флагу SEED_DATA=1) заполнение БД под межпроцессной блокировкой
+    bootstrap()
+    # Пулы фоновых задач (тяжелые действия админки выполняются вне запроса)
+    runner.start()
+    yield
+    runner.shutdown()
 
-# Создаем и заполняем тестовыми данными
-try:
-    seed_data()
-except Exception as e:
-    print(f"⚠️ Ошибка при заполнении тестовыми данными: {e}")
 
-app = FastAPI(title="Админка стройматериалов")
+app = FastAPI(title="Админка стройматериалов", lifespan=lifespan)
 
-# Инициализация админки
-admin = Admin(app, engine, title="Админка стройматериалов")
+# Метрики запросов и SQL в формате Prometheus
+for db_engine in ENGINES:
+    instrument_engine(db_engine)
+app.add_route("/metrics", metrics_endpoint, include_in_schema=False)
+app.include_router(api_router)
+app.include_router(pricing_router)
+app.include_router(trucks_router)
+app.include_router(export_router)
+app.include_router(jobs_router)
+
+# Инициализация админки: асинхронные сессии не занимают потоки пула на время I/O
+if ASYNC_MODE:
+    admin = Admin(
+        app, session_maker=AsyncSessionLocal, title="Админка стройматериалов", templates_dir="templates"
+    )
+else:
+    admin = Admin(app, session_maker=SessionLocal, title="Админка стройматериалов", templates_dir="templates")
 
 # Регистрация административных панелей
 admin.add_view(ProductCategoryAdmin)
@@ -34,6 +63,14 @@ admin.add_view(QuarryProductPriceAdmin)
 admin.add_view(CustomerAdmin)
 admin.add_view(TruckTypeAdmin)  # Регистрируем админку для типов машин
 admin.add_view(OrderAdmin)
+admin.add_view(ArchivedOrderAdmin)
+admin.add_view(SalesDashboardAdmin)
+admin.add_view(JobsAdmin)
+
+# Условные GET-запросы к справочникам админки (ETag по версиям таблиц);
+# метрики подключаются последними, чтобы учитывать и ответы 304
+app.add_middleware(HttpCacheMiddleware, admin=admin)
+app.add_middleware(MetricsMiddleware, admin=admin)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,237 @@
+# metrics.py
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from starlette.responses import PlainTextResponse
+
+logger = logging.getLogger(__name__)
+
+# Порог (мс) для записи медленных запросов в лог; 0 — не писать
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))
+# Сколько самых медленных запросов показывать в /metrics
+SLOWEST_LIMIT = 20
+# Сколько текстов SQL помнить вместе с их шаблонами
+TEMPLATE_CACHE_SIZE = 2000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ADMIN_PATH = re.compile(r"^/admin/(?P<identity>[\w-]+)/(?P<page>list|details|edit|create|delete|export|action|ajax)")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PARAM_LISTS = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)|\((?:\s*%\(\w+\)s\s*,)+\s*%\(\w+\)s\s*\)")
+_SPACES = re.compile(r"\s+")
+
+# Статистика SQL текущего запроса: [количество, суммарное время]
+_request_sql: ContextVar = ContextVar("request_sql", default=None)
+
+
+def normalize_sql(statement):
+    """Приводит SQL к шаблону: литералы и списки параметров IN заменяются на ?"""
+    statement = _LITERALS.sub("?", statement)
+    statement = _PARAM_LISTS.sub("(?)", statement)
+    return _SPACES.sub(" ", statement).strip()[:500]
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        index = bisect.bisect_left(LATENCY_BUCKETS, value)
+        if index < len(self.buckets):
+            self.buckets[index] += 1
+        self.count += 1
+        self.total += value
+
+
+class Metrics:
+    """
+    Метрики приложения в памяти процесса.
+
+    Обновление — несколько операций со словарями под одной блокировкой,
+    поэтому сбор можно держать включенным постоянно.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = {}        # (route, view, method, status) -> Histogram
+        self.statements = {}     # (route, view) -> количество SQL-запросов
+        self.db_seconds = {}     # (route, view) -> время в БД
+        self.slowest = {}        # нормализованный SQL -> [максимум, количество, сумма]
+        self._slowest_threshold = 0.0
+        self._templates = {}     # текст SQL -> нормализованный SQL
+
+    def observe_request(self, route, view, method, status, seconds, statements, db_seconds):
+        with self._lock:
+            key = (route, view, method, str(status))
+            histogram = self.latency.get(key)
+            if histogram is None:
+                histogram = self.latency[key] = Histogram()
+            histogram.observe(seconds)
+            self.statements[(route, view)] = self.statements.get((route, view), 0) + statements
+            self.db_seconds[(route, view)] = self.db_seconds.get((route, view), 0.0) + db_seconds
+
+    def template(self, statement):
+        """
+        Шаблон SQL с кешем по тексту запроса: SQLAlchemy кеширует скомпилированный
+        SQL, поэтому различных текстов немного и регулярные выражения выполняются
+        один раз на текст, а не на каждый запрос.
+        """
+        sql = self._templates.get(statement)
+        if sql is None:
+            sql = normalize_sql(statement)
+            if len(self._templates) >= TEMPLATE_CACHE_SIZE:
+                self._templates = {}
+            self._templates[statement] = sql
+        return sql
+
+    def observe_statement(self, statement, seconds):
+        sql = self.template(statement)
+        with self._lock:
+            entry = self.slowest.get(sql)
+            if entry is None:
+                if seconds < self._slowest_threshold:
+                    # Новый шаблон быстрее отслеживаемых в список не попадет;
+                    # у отслеживаемых учитываются все выполнения, иначе среднее завышено
+                    return
+                entry = self.slowest[sql] = [0.0, 0, 0.0]
+            entry[0] = max(entry[0], seconds)
+            entry[1] += 1
+            entry[2] += seconds
+            if len(self.slowest) > SLOWEST_LIMIT * 5:
+                keep = sorted(self.slowest.items(), key=lambda item: item[1][0], reverse=True)[:SLOWEST_LIMIT]
+                self.slowest = dict(keep)
+                self._slowest_threshold = keep[-1][1][0]
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        with self._lock:
+            lines.append("# HELP http_request_duration_seconds Время обработки запроса")
+            lines.append("# TYPE http_request_duration_seconds histogram")
+            for (route, view, method, status), histogram in sorted(self.latency.items()):
+                labels = f'route="{route}",view="{view}",method="{method}",status="{status}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"http_request_duration_seconds_sum{{{labels}}} {histogram.total}")
+                lines.append(f"http_request_duration_seconds_count{{{labels}}} {histogram.count}")
+
+            lines.append("# HELP db_statements_total SQL-запросы по маршрутам")
+            lines.append("# TYPE db_statements_total counter")
+            for (route, view), count in sorted(self.statements.items()):
+                lines.append(f'db_statements_total{{route="{route}",view="{view}"}} {count}')
+
+            lines.append("# HELP db_time_seconds_total Время в БД по маршрутам")
+            lines.append("# TYPE db_time_seconds_total counter")
+            for (route, view), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'db_time_seconds_total{{route="{route}",view="{view}"}} {seconds}')
+
+            lines.append("# HELP db_slowest_statement_seconds Самые медленные шаблоны SQL")
+            lines.append("# TYPE db_slowest_statement_seconds gauge")
+            slowest = sorted(self.slowest.items(), key=lambda item: item[1][0], reverse=True)[:SLOWEST_LIMIT]
+            for sql, (maximum, count, total) in slowest:
+                escaped = sql.replace("\\", "\\\\").replace('"', '\\"')
+                lines.append(f'db_slowest_statement_seconds{{sql="{escaped}",stat="max"}} {maximum}')
+                lines.append(f'db_slowest_statement_seconds{{sql="{escaped}",stat="avg"}} {total / count}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - context._metrics_started
+    current = _request_sql.get()
+    if current is not None:
+        current[0] += 1
+        current[1] += seconds
+    metrics.observe_statement(statement, seconds)
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Медленный запрос %.1f мс: %s", seconds * 1000, metrics.template(statement))
+
+
+def instrument_engine(engine):
+    """Подключает сбор времени SQL-запросов к движку (синхронному или асинхронному)"""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_labels(scope, identities):
+    """
+    (шаблон маршрута, ModelView) для запроса. Раздел берется из адреса, только
+    если он зарегистрирован в админке (identities), иначе — "other": произвольные
+    адреса не должны порождать новые серии метрик.
+    """
+    path = scope.get("path", "")
+    match = _ADMIN_PATH.match(path)
+    if match:
+        view = match["identity"] if match["identity"] in identities else "other"
+        return f"/admin/{{identity}}/{match['page']}", view
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path, ""
+    if path.startswith("/admin"):
+        return "/admin", ""
+    return "other", ""
+
+
+class MetricsMiddleware:
+    """ASGI-middleware: время запроса, число SQL-запросов и время в БД по маршрутам"""
+
+    def __init__(self, app, admin=None):
+        self.app = app
+        self.admin = admin
+        self._identities = None
+
+    def _admin_identities(self):
+        if self._identities is None:
+            views = self.admin.views if self.admin is not None else ()
+            self._identities = frozenset(
+                view.identity for view in views if getattr(view, "identity", None)
+            )
+        return self._identities
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") == "/metrics":
+            await self.app(scope, receive, send)
+            return
+
+        sql = [0, 0.0]
+        token = _request_sql.set(sql)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_sql.reset(token)
+            route, view = _route_labels(scope, self._admin_identities())
+            metrics.observe_request(
+                route, view, scope.get("method", ""), status,
+                time.perf_counter() - started, sql[0], sql[1],
+            )
+
+
+def metrics_endpoint(request):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
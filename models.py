@@ -1,8 +1,55 @@
-from sqlalchemy import Column, Float, Integer, String, ForeignKey, Boolean, DateTime, DECIMAL, Text, UniqueConstraint
-from sqlalchemy.orm import relationship
+import re
+from decimal import Decimal
+
+from sqlalchemy import Column, Float, Integer, String, ForeignKey, Boolean, Date, DateTime, DECIMAL, Text, UniqueConstraint, Index, case, select
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import column_property, relationship, validates
 from sqlalchemy.sql import func
 from database import Base
 
+# Единицы товара, которые возят по объему кузова; остальные — по грузоподъемности
+VOLUME_UNITS = ("м³",)
+
+# Статусы незавершенных заказов: им можно менять машины и цену
+OPEN_STATUSES = ("new", "in_progress")
+# Все статусы заказа
+ORDER_STATUSES = OPEN_STATUSES + ("completed", "cancelled")
+
+_NON_DIGITS = re.compile(r"\D")
+
+
+def normalize_phone(phone):
+    """Телефон только цифрами с кодом страны 7: «8 (900) 123-45-67» -> «79001234567»"""
+    digits = _NON_DIGITS.sub("", phone or "")
+    if len(digits) == 11 and digits[0] == "8":
+        digits = "7" + digits[1:]
+    elif len(digits) == 10 and digits[0] == "9":
+        digits = "7" + digits
+    return digits or None
+
+
+def normalize_email(email):
+    email = (email or "").strip().lower()
+    return email or None
+
+class SchemaVersion(Base):
+    __tablename__ = 'schemaversion'
+    
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, comment="Версия схемы")
+    
+    def __repr__(self):
+        return f"Схема v{self.version}"
+
+class ModelVersion(Base):
+    __tablename__ = 'modelversion'
+    
+    name = Column(String(50), primary_key=True, comment="Имя таблицы")
+    version = Column(Integer, nullable=False, default=0, comment="Номер версии данных")
+    
+    def __repr__(self):
+        return f"{self.name} v{self.version}"
+
 class ProductCategory(Base):
     __tablename__ = 'productcategory'
     
@@ -43,7 +90,7 @@ class QuarryProductPrice(Base):
     
     id = Column(Integer, primary_key=True)
     quarry_id = Column(Integer, ForeignKey('quarry.id', ondelete='CASCADE'))
-    product_id = Column(Integer, ForeignKey('producttype.id', ondelete='CASCADE'))
+    product_id = Column(Integer, ForeignKey('producttype.id', ondelete='CASCADE'), index=True)
     price = Column(DECIMAL(10, 2), nullable=False, comment="Цена")
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), comment="Обновлено")
     
@@ -64,8 +111,22 @@ class Customer(Base):
     email = Column(String(255), nullable=True, comment="Email")
     address = Column(Text, nullable=False, comment="Адрес доставки")
     
+    # Нормализованные контакты для поиска по префиксу и поиска дублей
+    phone_normalized = Column(String(20), nullable=True, index=True, comment="Телефон (цифры)")
+    email_normalized = Column(String(255), nullable=True, index=True, comment="Email (нижний регистр)")
+    
     orders = relationship("Order", back_populates="customer")
     
+    @validates("phone")
+    def _set_phone_normalized(self, key, phone):
+        self.phone_normalized = normalize_phone(phone)
+        return phone
+    
+    @validates("email")
+    def _set_email_normalized(self, key, email):
+        self.email_normalized = normalize_email(email)
+        return email
+    
     def __repr__(self):
         return f"{self.full_name} ({self.phone})"
 
@@ -87,15 +148,15 @@ class Order(Base):
     __tablename__ = 'order'
     
     id = Column(Integer, primary_key=True)
-    customer_id = Column(Integer, ForeignKey('customer.id', ondelete='SET NULL'), nullable=True)
+    customer_id = Column(Integer, ForeignKey('customer.id', ondelete='SET NULL'), nullable=True, index=True)
     created_at = Column(DateTime, server_default=func.now())
     status = Column(String(20), default="new", comment="Статус заказа")
     total_price = Column(DECIMAL(10, 2), nullable=False, comment="Итоговая стоимость")
     delivery_address = Column(Text, nullable=False, comment="Адрес доставки")
     
     # Поля товара (ранее были в OrderItem)
-    product_id = Column(Integer, ForeignKey('producttype.id'), nullable=False)
-    quarry_id = Column(Integer, ForeignKey('quarry.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('producttype.id'), nullable=False, index=True)
+    quarry_id = Column(Integer, ForeignKey('quarry.id'), nullable=False, index=True)
     quantity = Column(Float, nullable=False, comment="Количество товара")
     price_per_unit = Column(DECIMAL(10, 2), nullable=False, comment="Цена за единицу")
     
@@ -105,11 +166,46 @@ class Order(Base):
     quarry = relationship("Quarry", lazy="joined")
     trucks = relationship("OrderTruck", back_populates="order", cascade="all, delete-orphan")
     
-    # Вычисляемое свойство для проверки
-    @property
+    # created_at заполняется БД; читаем его сразу после INSERT для агрегатов продаж
+    __mapper_args__ = {"eager_defaults": True}
+    
+    # Сортировка списка по дате (id — для однозначного порядка) и фильтр по статусу.
+    # AUTOINCREMENT: SQLite не выдает повторно id заказов, перенесенных в архив
+    __table_args__ = (
+        Index('ix_order_created_at_id', 'created_at', 'id'),
+        Index('ix_order_status_created_at', 'status', 'created_at'),
+        {"sqlite_autoincrement": True},
+    )
+    
+    # Вычисляемые поля доступны и в SQL, поэтому по ним можно сортировать и фильтровать
+    @hybrid_property
     def item_total(self):
-        return self.quantity * self.price_per_unit
+        return Decimal(str(self.quantity)) * self.price_per_unit
+    
+    @item_total.expression
+    def item_total(cls):
+        return cls.quantity * cls.price_per_unit
+    
+    @hybrid_property
+    def fleet_total(self):
+        """Вместимость назначенных машин в единицах товара (объем или тоннаж)"""
+        if self.product.base_unit in VOLUME_UNITS:
+            return self.fleet_volume
+        return self.fleet_capacity
+    
+    @fleet_total.expression
+    def fleet_total(cls):
+        base_unit = select(ProductType.base_unit).where(ProductType.id == cls.product_id).scalar_subquery()
+        return case((base_unit.in_(VOLUME_UNITS), cls.fleet_volume), else_=cls.fleet_capacity)
     
+    @hybrid_property
+    def is_under_provisioned(self):
+        """Машин не хватает, чтобы вывезти весь заказ"""
+        return self.fleet_total < self.quantity
+    
+    @is_under_provisioned.expression
+    def is_under_provisioned(cls):
+        return cls.fleet_total < cls.quantity
 
     @property
     def trucks_summary(self):
@@ -130,21 +226,158 @@ class OrderTruck(Base):
     __tablename__ = 'ordertruck'
     
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey('order.id', ondelete='CASCADE'))
+    order_id = Column(Integer, ForeignKey('order.id', ondelete='CASCADE'), index=True)
     truck_type_id = Column(Integer, ForeignKey('trucktype.id'), nullable=False)
     count = Column(Integer, nullable=False, default=1, comment="Количество машин")
     
     order = relationship("Order", back_populates="trucks")
     truck_type = relationship("TruckType", lazy="joined")
     
-    # Вычисляемые свойства для удобства
-    @property
+    # Как и у заказов: id машин, перенесенных в архив, не выдаются повторно
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    # Вычисляемые свойства для удобства (доступны и в SQL)
+    @hybrid_property
     def total_volume(self):
         return self.truck_type.volume * self.count
     
-    @property
+    @total_volume.expression
+    def total_volume(cls):
+        volume = select(TruckType.volume).where(TruckType.id == cls.truck_type_id).scalar_subquery()
+        return volume * cls.count
+    
+    @hybrid_property
     def total_capacity(self):
         return self.truck_type.load_capacity * self.count
     
+    @total_capacity.expression
+    def total_capacity(cls):
+        capacity = select(TruckType.load_capacity).where(TruckType.id == cls.truck_type_id).scalar_subquery()
+        return capacity * cls.count
+    
     def __repr__(self):
         return f"{self.truck_type.name} x {self.count}"
+
+
+
+class OrderPriceAudit(Base):
+    __tablename__ = 'orderpriceaudit'
+    
+    id = Column(Integer, primary_key=True)
+    order_id = Column(Integer, nullable=False, index=True, comment="Заказ")
+    batch_id = Column(String(36), nullable=False, index=True, comment="Пакет пересчета")
+    old_price = Column(DECIMAL(10, 2), nullable=False, comment="Старая цена")
+    new_price = Column(DECIMAL(10, 2), nullable=False, comment="Новая цена")
+    old_total = Column(DECIMAL(10, 2), nullable=False, comment="Старая стоимость")
+    new_total = Column(DECIMAL(10, 2), nullable=False, comment="Новая стоимость")
+    reason = Column(String(255), nullable=True, comment="Причина")
+    changed_at = Column(DateTime, server_default=func.now(), comment="Изменено")
+    
+    def __repr__(self):
+        return f"Заказ #{self.order_id}: {self.old_price} → {self.new_price}"
+
+
+def _order_fleet(truck_attribute):
+    """Коррелированный подзапрос: суммарная характеристика машин заказа"""
+    return (
+        select(func.coalesce(func.sum(truck_attribute * OrderTruck.count), 0.0))
+        .select_from(OrderTruck)
+        .join(TruckType, TruckType.id == OrderTruck.truck_type_id)
+        .where(OrderTruck.order_id == Order.id)
+        .correlate_except(OrderTruck, TruckType)
+        .scalar_subquery()
+    )
+
+
+# Суммарные объем и грузоподъемность машин заказа, считаются в SQL по индексу ordertruck.order_id.
+# Отложенные: загружаются только там, где нужны (undefer в списке заказов админки)
+Order.fleet_volume = column_property(_order_fleet(TruckType.volume), deferred=True)
+Order.fleet_capacity = column_property(_order_fleet(TruckType.load_capacity), deferred=True)
+
+# Продажи за день по карьеру, товару и статусу (поддерживается reports.py)
+class DailySales(Base):
+    __tablename__ = 'dailysales'
+    
+    day = Column(Date, primary_key=True, comment="День")
+    quarry_id = Column(Integer, primary_key=True, comment="Карьер")
+    product_id = Column(Integer, primary_key=True, comment="Вид товара")
+    status = Column(String(20), primary_key=True, comment="Статус заказа")
+    order_count = Column(Integer, nullable=False, default=0, comment="Заказов")
+    quantity = Column(Float, nullable=False, default=0, comment="Количество товара")
+    revenue = Column(DECIMAL(14, 2), nullable=False, default=0, comment="Выручка")
+    
+    def __repr__(self):
+        return f"{self.day}: {self.revenue}"
+
+
+# Архив закрытых заказов (переносятся archive.py); только для чтения
+class ArchivedOrder(Base):
+    __tablename__ = 'orderarchive'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    customer_id = Column(Integer, ForeignKey('customer.id', ondelete='SET NULL'), nullable=True, index=True)
+    created_at = Column(DateTime, nullable=True)
+    status = Column(String(20), comment="Статус заказа")
+    total_price = Column(DECIMAL(10, 2), nullable=False, comment="Итоговая стоимость")
+    delivery_address = Column(Text, nullable=False, comment="Адрес доставки")
+    product_id = Column(Integer, ForeignKey('producttype.id'), nullable=False)
+    quarry_id = Column(Integer, ForeignKey('quarry.id'), nullable=False)
+    quantity = Column(Float, nullable=False, comment="Количество товара")
+    price_per_unit = Column(DECIMAL(10, 2), nullable=False, comment="Цена за единицу")
+    archived_at = Column(DateTime, server_default=func.now(), comment="Перенесен в архив")
+    
+    customer = relationship("Customer", lazy="joined")
+    product = relationship("ProductType", lazy="joined")
+    quarry = relationship("Quarry", lazy="joined")
+    trucks = relationship("ArchivedOrderTruck", back_populates="order")
+    
+    __table_args__ = (
+        Index('ix_orderarchive_created_at_id', 'created_at', 'id'),
+    )
+    
+    @property
+    def trucks_summary(self):
+        if not self.trucks:
+            return "Машины не назначены"
+        return ", ".join(f"{truck.truck_type.name} × {truck.count}" for truck in self.trucks)
+    
+    def __repr__(self):
+        return f"Архивный заказ #{self.id}"
+
+
+class ArchivedOrderTruck(Base):
+    __tablename__ = 'ordertruckarchive'
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    order_id = Column(Integer, ForeignKey('orderarchive.id', ondelete='CASCADE'), index=True)
+    truck_type_id = Column(Integer, ForeignKey('trucktype.id'), nullable=False)
+    count = Column(Integer, nullable=False, default=1, comment="Количество машин")
+    
+    order = relationship("ArchivedOrder", back_populates="trucks")
+    truck_type = relationship("TruckType", lazy="joined")
+    
+    def __repr__(self):
+        return f"{self.truck_type.name} x {self.count}"
+
+
+# Фоновые задачи (выполняются jobs.py)
+class Job(Base):
+    __tablename__ = 'job'
+    
+    id = Column(String(32), primary_key=True)
+    name = Column(String(50), nullable=False, comment="Задача")
+    status = Column(String(20), nullable=False, default="queued", comment="Состояние")
+    params = Column(Text, nullable=True, comment="Параметры (JSON)")
+    progress = Column(Float, nullable=True, comment="Выполнено, доля")
+    message = Column(String(255), nullable=True, comment="Текущий шаг")
+    result = Column(Text, nullable=True, comment="Результат (JSON)")
+    error = Column(Text, nullable=True, comment="Ошибка")
+    created_at = Column(DateTime, server_default=func.now(), comment="Создана")
+    started_at = Column(DateTime, nullable=True, comment="Начата")
+    finished_at = Column(DateTime, nullable=True, comment="Завершена")
+    worker = Column(String(100), nullable=True, comment="Воркер (хост:pid)")
+    
+    __table_args__ = (Index('ix_job_created_at', 'created_at'),)
+    
+    def __repr__(self):
+        return f"{self.name} ({self.status})"
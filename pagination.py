@@ -0,0 +1,227 @@
+# pagination.py
+import base64
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqladmin._types import _UNSET
+from sqladmin.pagination import Pagination
+from sqlalchemy import and_, func, or_, select, text, tuple_
+from sqlalchemy.orm import selectinload
+from starlette import status
+from starlette.datastructures import URL
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+
+from database import engine
+
+
+@dataclass
+class KeysetPagination(Pagination):
+    """Pagination, у которой ссылка на следующую страницу содержит курсор"""
+
+    next_cursor: Optional[str] = None
+
+    def add_pagination_urls(self, base_url: URL) -> None:
+        super().add_pagination_urls(base_url.remove_query_params("after"))
+        if self.next_cursor is None:
+            return
+        for page_control in self.page_controls:
+            if page_control.number == self.page + 1:
+                page_control.url = str(URL(page_control.url).include_query_params(after=self.next_cursor))
+
+
+class KeysetPaginationMixin:
+    """
+    Keyset-пагинация для ModelView.
+
+    Вместо OFFSET страница выбирается условием (keyset_column, id) < курсор,
+    поэтому стоимость страницы не зависит от ее номера. Курсор передается в
+    ссылке «следующая страница»; границы уже открытых страниц запоминаются,
+    так что переход назад тоже обходится без OFFSET. Если курсора нет
+    (прямой переход на произвольную страницу) или список отсортирован
+    по другому столбцу, используется обычный OFFSET.
+
+    Строки с пустым keyset_column идут в конце списка при любом направлении
+    сортировки (NULLS LAST) и внутри этой группы упорядочены по id.
+
+    Общее количество строк кешируется на count_cache_ttl секунд,
+    для PostgreSQL без поиска и фильтров берется оценка из статистики pg_class.
+    """
+
+    keyset_column = "created_at"
+    count_cache_ttl = 60
+    cursor_cache_size = 10_000
+    count_cache_size = 1_000
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Границы открытых страниц: (отбор, по убыванию, размер, номер) -> (значение, id)
+        self._keyset_cursors = OrderedDict()
+        # Количество строк: параметры отбора -> (количество, момент устаревания)
+        self._keyset_counts = OrderedDict()
+
+    def _keyset_key(self, request: Request):
+        """(столбец, по убыванию) или None, если сортировка не по keyset_column"""
+        sort_by = request.query_params.get("sortBy")
+        if sort_by:
+            if sort_by != self.keyset_column:
+                return None
+            descending = request.query_params.get("sort") == "desc"
+        else:
+            default_sort = dict(self.column_default_sort or [(self.keyset_column, True)])
+            if self.keyset_column not in default_sort:
+                return None
+            descending = default_sort[self.keyset_column]
+        return getattr(self.model, self.keyset_column), descending
+
+    def _encode_cursor(self, row):
+        value = getattr(row, self.keyset_column)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        raw = json.dumps([value, row.id]).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def _decode_cursor(self, cursor, column):
+        try:
+            value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if value is not None and column.type.python_type is datetime:
+                value = datetime.fromisoformat(value)
+            return value, int(row_id)
+        except (ValueError, TypeError, NotImplementedError):
+            return None
+
+    def _seek_bound(self, column, cursor):
+        """
+        Граница страницы для сравнения (значение, id) < курсор.
+
+        Значение берется из самой строки курсора: SQLite сравнивает даты как
+        текст, а строки, созданные через ORM, хранят их без долей секунды
+        ('YYYY-MM-DD HH:MM:SS'), тогда как параметр запроса передается
+        с ними — сравнение с параметром захватило бы всю секунду.
+        Значение из курсора нужно, только если строку уже удалили.
+        """
+        value, row_id = cursor
+        stored = select(column).where(self.model.id == row_id).correlate(None).scalar_subquery()
+        return func.coalesce(stored, value), row_id
+
+    def _seek_condition(self, column, cursor, descending):
+        """
+        Условие «строка после курсора» с учетом NULLS LAST: после непустого
+        значения идут и все строки с NULL, после NULL — только строки с NULL
+        и следующим id.
+        """
+        value, row_id = cursor
+        if value is None:
+            after_id = self.model.id < row_id if descending else self.model.id > row_id
+            return and_(column.is_(None), after_id)
+        seek = tuple_(column, self.model.id)
+        bound = tuple_(*self._seek_bound(column, cursor))
+        return or_(seek < bound if descending else seek > bound, column.is_(None))
+
+    async def _cached_count(self, request: Request, stmt, selection):
+        cached = self._keyset_counts.get(selection)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        if not selection and engine.dialect.name == "postgresql":
+            estimate = await self._run_query(
+                select(text("reltuples::bigint")).select_from(text("pg_class"))
+                .where(text("oid = CAST(:table AS regclass)")).params(table=self.model.__tablename__)
+            )
+            count = max(int(estimate[0]), 0) if estimate else 0
+        else:
+            count = await self.count(request, select(func.count()).select_from(stmt.subquery()))
+        counts = self._keyset_counts
+        counts[selection] = (count, time.monotonic() + self.count_cache_ttl)
+        counts.move_to_end(selection)
+        while len(counts) > self.count_cache_size:
+            counts.popitem(last=False)
+        return count
+
+    async def _filtered_query(self, request: Request):
+        """
+        Запрос списка с фильтрами и поиском без сортировки — так же, как
+        в ModelView.list: значения фильтров по умолчанию и фильтры с операторами.
+        """
+        stmt = self.list_query(request)
+        for relation in self._list_relations:
+            stmt = stmt.options(selectinload(relation))
+        for list_filter in self.get_filters():
+            value = request.query_params.get(list_filter.parameter_name)
+            if not value and getattr(list_filter, "default_value", _UNSET) is _UNSET:
+                continue
+            if getattr(list_filter, "has_operator", False):
+                operation = request.query_params.get(f"{list_filter.parameter_name}_op")
+                if operation:
+                    stmt = await list_filter.get_filtered_query(stmt, operation, value, self.model)
+            else:
+                stmt = await list_filter.get_filtered_query(stmt, value, self.model)
+        search = request.query_params.get("search", None)
+        if search:
+            stmt = self.search_query(stmt=stmt, term=search)
+        return stmt
+
+    async def list(self, request: Request) -> Pagination:
+        keyset = self._keyset_key(request)
+        if keyset is None:
+            return await super().list(request)
+        column, descending = keyset
+
+        requested_page = self.validate_page_number(request.query_params.get("page"), 1)
+        page_size = self.validate_page_number(request.query_params.get("pageSize"), self.page_size)
+        page_size = min(page_size, max(self.page_size_options))
+        if page_size < 1:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page or pageSize parameter")
+
+        stmt = await self._filtered_query(request)
+
+        # Поиск и фильтры определяют набор строк, поэтому входят в ключи кешей
+        selection = tuple(sorted(
+            (name, value) for name, value in request.query_params.items()
+            if name not in ("page", "pageSize", "after", "sortBy", "sort")
+        ))
+        count = await self._cached_count(request, stmt, selection)
+        # Номер страницы за пределами списка приводится к последней, как в ModelView.list
+        page = min(max(requested_page, 1), Pagination.max_page(count, page_size))
+
+        # Курсор предыдущей страницы: из ссылки или из кеша уже открытых страниц
+        cursors = self._keyset_cursors
+        cache_key = (selection, descending, page_size)
+        cursor = None
+        if page > 1:
+            after = request.query_params.get("after") if page == requested_page else None
+            cursor = self._decode_cursor(after, column) if after else None
+            if cursor is None:
+                cursor = cursors.get(cache_key + (page - 1,))
+
+        if descending:
+            stmt = stmt.order_by(column.desc().nulls_last(), self.model.id.desc())
+        else:
+            stmt = stmt.order_by(column.asc().nulls_last(), self.model.id.asc())
+
+        if cursor is not None:
+            stmt = stmt.where(self._seek_condition(column, cursor, descending))
+            stmt = stmt.limit(page_size)
+        else:
+            stmt = stmt.limit(page_size).offset((page - 1) * page_size)
+        rows = await self._run_query(stmt)
+
+        next_cursor = None
+        if rows:
+            last = rows[-1]
+            cursors[cache_key + (page,)] = (getattr(last, self.keyset_column), last.id)
+            cursors.move_to_end(cache_key + (page,))
+            while len(cursors) > self.cursor_cache_size:
+                cursors.popitem(last=False)
+            next_cursor = self._encode_cursor(last)
+
+        return KeysetPagination(
+            rows=rows,
+            page=page,
+            page_size=page_size,
+            count=count,
+            next_cursor=next_cursor,
+        )
@@ -0,0 +1,410 @@
+# pricing.py
+import argparse
+import csv
+import io
+import os
+import threading
+import time
+import uuid
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from fastapi import APIRouter, File, HTTPException, Query, UploadFile
+from sqlalchemy import and_, func, insert, literal, select, tuple_, update
+
+from database import engine, get_db, upsert_insert
+from models import OPEN_STATUSES, Order, OrderPriceAudit, ProductType, Quarry, QuarryProductPrice
+from reports import apply_sales_deltas
+from versions import bump_model_version, get_model_version, track_model_versions
+
+PRICE_VERSION_NAME = QuarryProductPrice.__tablename__
+track_model_versions(PRICE_VERSION_NAME)
+
+# Как часто (сек) сверять версию матрицы с БД, чтобы заметить изменения из других воркеров
+PRICE_CHECK_INTERVAL = float(os.getenv("PRICE_CHECK_INTERVAL", "5"))
+
+
+class PriceMatrix:
+    """
+    Матрица цен (quarry_id, product_id) -> цена в памяти процесса.
+
+    Загружается одним запросом без JOIN-ов и сверяется с версией цен в БД
+    не чаще раза в PRICE_CHECK_INTERVAL секунд, поэтому получение цены —
+    чтение словаря.
+    """
+
+    def __init__(self):
+        self._prices = {}
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Перечитывает всю матрицу из БД"""
+        with get_db() as db:
+            version = get_model_version(db, PRICE_VERSION_NAME)
+            rows = db.execute(select(
+                QuarryProductPrice.quarry_id,
+                QuarryProductPrice.product_id,
+                QuarryProductPrice.price,
+            ))
+            self._prices = {(quarry_id, product_id): price for quarry_id, product_id, price in rows}
+        self.version = version
+        self._checked_at = time.monotonic()
+
+    def ensure_fresh(self):
+        """Перезагружает матрицу, если цены изменились в другом воркере"""
+        if self.version is not None and time.monotonic() - self._checked_at < PRICE_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self.version is not None and time.monotonic() - self._checked_at < PRICE_CHECK_INTERVAL:
+                return
+            if self.version is not None:
+                with get_db() as db:
+                    current = get_model_version(db, PRICE_VERSION_NAME)
+                if current == self.version:
+                    self._checked_at = time.monotonic()
+                    return
+            self.load()
+
+    def get(self, quarry_id, product_id):
+        """Цена товара в карьере или None, если карьер его не продает"""
+        self.ensure_fresh()
+        return self._prices.get((quarry_id, product_id))
+
+    def items(self):
+        """Все цены матрицы: [((quarry_id, product_id), цена), ...]"""
+        self.ensure_fresh()
+        return list(self._prices.items())
+
+    def invalidate(self):
+        """Сбрасывает матрицу: она будет перечитана при следующем обращении"""
+        with self._lock:
+            self.version = None
+
+    def _apply(self, version, change):
+        # Точечное изменение допустимо, только если между версиями не было чужих изменений
+        with self._lock:
+            if self.version is not None and version == self.version + 1:
+                change()
+                self.version = version
+            else:
+                self.version = None
+
+    def set(self, quarry_id, product_id, price, version, old_key=None):
+        """
+        Обновляет одну ячейку после изменения цены, получившего версию version;
+        old_key — прежние (quarry_id, product_id), если цену перенесли в другую ячейку.
+        """
+        def change():
+            if old_key is not None and old_key != (quarry_id, product_id):
+                self._prices.pop(old_key, None)
+            self._prices[(quarry_id, product_id)] = price
+
+        self._apply(version, change)
+
+    def discard(self, quarry_id, product_id, version):
+        """Удаляет одну ячейку после удаления цены, получившего версию version"""
+        self._apply(version, lambda: self._prices.pop((quarry_id, product_id), None))
+
+
+price_matrix = PriceMatrix()
+
+# Строк прайс-листа в одном INSERT ... ON CONFLICT
+IMPORT_CHUNK_SIZE = 1000
+# Сколько отклоненных строк с причинами возвращать в отчете
+IMPORT_MAX_ERRORS = 100
+
+# Допустимые заголовки колонок прайс-листа
+IMPORT_HEADERS = {
+    "quarry": "quarry", "карьер": "quarry",
+    "product": "product", "товар": "product",
+    "price": "price", "цена": "price",
+}
+
+
+def price_version():
+    """
+    Текущая версия цен. Изменения цен через ORM увеличивают ее
+    автоматически (см. versions.py).
+    """
+    with get_db() as db:
+        return get_model_version(db, PRICE_VERSION_NAME)
+
+def read_price_rows(file, filename):
+    """
+    Построчно читает прайс-лист CSV или XLSX с колонками карьер, товар, цена.
+    Возвращает итератор словарей {"quarry", "product", "price"}.
+    """
+    if filename.lower().endswith(".xlsx"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError("Для импорта XLSX установите openpyxl")
+        sheet = load_workbook(file, read_only=True, data_only=True).active
+        rows = sheet.iter_rows(values_only=True)
+    else:
+        text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+        sample = text.read(4096)
+        text.seek(0)
+        dialect = csv.Sniffer().sniff(sample, delimiters=";,\t") if sample else csv.excel
+        rows = csv.reader(text, dialect)
+
+    header = next(rows, None) or []
+    columns = [IMPORT_HEADERS.get(str(name or "").strip().lower()) for name in header]
+    missing = {"quarry", "product", "price"} - set(columns)
+    if missing:
+        raise ValueError(f"В прайс-листе нет колонок: {', '.join(sorted(missing))}")
+    for row in rows:
+        yield {column: value for column, value in zip(columns, row) if column}
+
+
+def _parse_price(value):
+    if isinstance(value, (int, float, Decimal)):
+        price = Decimal(str(value))
+    else:
+        price = Decimal(str(value or "").replace("\xa0", "").replace(" ", "").replace(",", "."))
+    if price <= 0:
+        raise InvalidOperation
+    return price.quantize(Decimal("0.01"))
+
+
+def import_price_list(rows):
+    """
+    Применяет прайс-лист одной транзакцией.
+
+    Названия карьеров и товаров сопоставляются с id по словарям, загруженным
+    один раз; цены записываются пачками INSERT ... ON CONFLICT (quarry_id,
+    product_id) DO UPDATE по ограничению unique_quarry_product.
+    Возвращает {"inserted", "updated", "rejected", "errors"}.
+    """
+    report = {"inserted": 0, "updated": 0, "rejected": 0, "errors": []}
+
+    def reject(line, reason):
+        report["rejected"] += 1
+        if len(report["errors"]) < IMPORT_MAX_ERRORS:
+            report["errors"].append({"line": line, "error": reason})
+
+    with get_db() as db:
+        quarries = dict(db.execute(select(Quarry.name, Quarry.id)).all())
+        products = dict(db.execute(select(ProductType.name, ProductType.id)).all())
+        existing = set(db.execute(select(QuarryProductPrice.quarry_id, QuarryProductPrice.product_id)).all())
+
+        # Повтор пары в файле — побеждает последняя строка
+        prices = {}
+        for line, row in enumerate(rows, start=2):
+            quarry_id = quarries.get(str(row.get("quarry") or "").strip())
+            product_id = products.get(str(row.get("product") or "").strip())
+            if quarry_id is None:
+                reject(line, f"Неизвестный карьер: {row.get('quarry')}")
+                continue
+            if product_id is None:
+                reject(line, f"Неизвестный товар: {row.get('product')}")
+                continue
+            try:
+                prices[(quarry_id, product_id)] = _parse_price(row.get("price"))
+            except InvalidOperation:
+                reject(line, f"Некорректная цена: {row.get('price')}")
+
+        if prices:
+            stmt = upsert_insert(QuarryProductPrice, db.bind.dialect.name)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=["quarry_id", "product_id"],
+                set_={"price": stmt.excluded.price, "updated_at": func.now()},
+            )
+            values = [
+                {"quarry_id": quarry_id, "product_id": product_id, "price": price}
+                for (quarry_id, product_id), price in prices.items()
+            ]
+            for start in range(0, len(values), IMPORT_CHUNK_SIZE):
+                db.execute(stmt, values[start:start + IMPORT_CHUNK_SIZE])
+            bump_model_version(db, PRICE_VERSION_NAME)
+        db.commit()
+
+    report["updated"] = sum(1 for key in prices if key in existing)
+    report["inserted"] = len(prices) - report["updated"]
+    if prices:
+        price_matrix.invalidate()
+    return report
+
+
+# Заказов в одной транзакции пересчета: блокировка записи держится недолго
+REPRICE_CHUNK_SIZE = 5000
+# Сколько изменений показывать в пробном прогоне
+REPRICE_PREVIEW_SIZE = 100
+
+
+def _reprice_candidates(pairs=None, quarry_id=None, product_id=None):
+    """Открытые заказы, цена которых расходится с текущим прайсом карьера"""
+    stmt = (
+        select(
+            Order.id.label("order_id"),
+            Order.price_per_unit.label("old_price"),
+            QuarryProductPrice.price.label("new_price"),
+            Order.total_price.label("old_total"),
+            func.round(QuarryProductPrice.price * Order.quantity, 2).label("new_total"),
+        )
+        .join(QuarryProductPrice, and_(
+            QuarryProductPrice.quarry_id == Order.quarry_id,
+            QuarryProductPrice.product_id == Order.product_id,
+        ))
+        .where(Order.status.in_(OPEN_STATUSES), Order.price_per_unit != QuarryProductPrice.price)
+    )
+    if pairs:
+        stmt = stmt.where(tuple_(Order.quarry_id, Order.product_id).in_(pairs))
+    if quarry_id is not None:
+        stmt = stmt.where(Order.quarry_id == quarry_id)
+    if product_id is not None:
+        stmt = stmt.where(Order.product_id == product_id)
+    return stmt
+
+
+def _revenue_deltas(conn, batch_id, order_ids):
+    """Изменение выручки пакета по ключам агрегатов продаж"""
+    day = func.date(Order.created_at)
+    rows = conn.execute(
+        select(
+            day, Order.quarry_id, Order.product_id, Order.status,
+            func.sum(OrderPriceAudit.new_total - OrderPriceAudit.old_total),
+        )
+        .join(OrderPriceAudit, OrderPriceAudit.order_id == Order.id)
+        .where(OrderPriceAudit.batch_id == batch_id, Order.id.in_(order_ids))
+        .group_by(day, Order.quarry_id, Order.product_id, Order.status)
+    )
+    deltas = {}
+    for day_value, quarry_id, product_id, status, revenue in rows:
+        if isinstance(day_value, str):
+            day_value = date.fromisoformat(day_value)
+        deltas[(day_value, quarry_id, product_id, status or "new")] = [0, 0.0, Decimal(str(revenue or 0))]
+    return deltas
+
+
+def reprice_open_orders(pairs=None, quarry_id=None, product_id=None, dry_run=False, reason=None):
+    """
+    Приводит цену и стоимость открытых заказов к текущему прайсу.
+
+    Каждая пачка — одна короткая транзакция из трех set-based запросов:
+    INSERT ... SELECT строк аудита, поправка агрегатов продаж и
+    UPDATE ... FROM по строкам аудита. В пробном прогоне (dry_run)
+    ничего не меняется, возвращаются количество и первые изменения.
+    """
+    candidates = _reprice_candidates(pairs, quarry_id, product_id)
+    if dry_run:
+        with engine.connect() as conn:
+            count = conn.execute(select(func.count()).select_from(candidates.subquery())).scalar()
+            preview = conn.execute(candidates.order_by(Order.id).limit(REPRICE_PREVIEW_SIZE)).mappings().all()
+        return {"dry_run": True, "count": count, "preview": [dict(row) for row in preview]}
+
+    with engine.connect() as conn:
+        order_ids = conn.execute(select(candidates.subquery().c.order_id)).scalars().all()
+
+    batch_id = uuid.uuid4().hex
+    for start in range(0, len(order_ids), REPRICE_CHUNK_SIZE):
+        chunk = order_ids[start:start + REPRICE_CHUNK_SIZE]
+        changes = candidates.where(Order.id.in_(chunk)).subquery()
+        with engine.begin() as conn:
+            conn.execute(insert(OrderPriceAudit).from_select(
+                ["order_id", "old_price", "new_price", "old_total", "new_total", "batch_id", "reason"],
+                select(*changes.c, literal(batch_id), literal(reason)),
+            ))
+            apply_sales_deltas(conn, _revenue_deltas(conn, batch_id, chunk))
+            conn.execute(
+                update(Order)
+                .where(
+                    Order.id == OrderPriceAudit.order_id,
+                    OrderPriceAudit.batch_id == batch_id,
+                    Order.id.in_(chunk),
+                )
+                .values(price_per_unit=OrderPriceAudit.new_price, total_price=OrderPriceAudit.new_total)
+            )
+    return {"dry_run": False, "count": len(order_ids), "batch_id": batch_id}
+
+
+router = APIRouter(prefix="/api/prices", tags=["prices"])
+
+
+@router.get("/quote")
+def quote(
+    quarry_id: int,
+    product_id: int,
+    quantity: float = Query(1, gt=0, description="Количество товара"),
+):
+    """Цена товара в карьере и стоимость указанного количества"""
+    price = price_matrix.get(quarry_id, product_id)
+    if price is None:
+        raise HTTPException(status_code=404, detail="Карьер не продает этот товар")
+    return {
+        "quarry_id": quarry_id,
+        "product_id": product_id,
+        "price": price,
+        "quantity": quantity,
+        "total": round(float(price) * quantity, 2),
+        "version": price_matrix.version,
+    }
+
+
+@router.post("/import")
+def import_prices(file: UploadFile = File(..., description="Прайс-лист CSV или XLSX")):
+    """Массовый импорт цен: добавляет новые и обновляет существующие"""
+    try:
+        return import_price_list(read_price_rows(file.file, file.filename or ""))
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/reprice")
+def reprice_preview(quarry_id: int = None, product_id: int = None):
+    """Пробный прогон пересчета: сколько открытых заказов изменится и как"""
+    return reprice_open_orders(quarry_id=quarry_id, product_id=product_id, dry_run=True)
+
+
+@router.post("/reprice", status_code=202)
+def reprice(quarry_id: int = None, product_id: int = None, reason: str = None):
+    """
+    Пересчет цены открытых заказов по текущему прайсу — фоновой задачей reprice;
+    состояние и результат — GET /api/jobs/{id}
+    """
+    # jobs импортирует pricing: импорт здесь, чтобы не было цикла
+    from jobs import runner
+
+    return {"id": runner.enqueue("reprice", quarry_id=quarry_id, product_id=product_id, reason=reason)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Цены карьеров")
+    commands = parser.add_subparsers(dest="command", required=True)
+    import_parser = commands.add_parser("import", help="Импорт прайс-листа")
+    import_parser.add_argument("path", help="Файл CSV или XLSX с колонками карьер, товар, цена")
+    reprice_parser = commands.add_parser("reprice", help="Пересчет открытых заказов по прайсу")
+    reprice_parser.add_argument("--quarry-id", type=int, help="Только заказы этого карьера")
+    reprice_parser.add_argument("--product-id", type=int, help="Только заказы этого товара")
+    reprice_parser.add_argument("--dry-run", action="store_true", help="Показать изменения без записи")
+    reprice_parser.add_argument("--reason", help="Причина для журнала изменений")
+    args = parser.parse_args()
+    started = time.perf_counter()
+
+    if args.command == "import":
+        with open(args.path, "rb") as price_file:
+            result = import_price_list(read_price_rows(price_file, args.path))
+        print(
+            f"✅ Импорт за {time.perf_counter() - started:.1f} с: добавлено {result['inserted']}, "
+            f"обновлено {result['updated']}, отклонено {result['rejected']}"
+        )
+        for error in result["errors"]:
+            print(f"  строка {error['line']}: {error['error']}")
+    else:
+        result = reprice_open_orders(
+            quarry_id=args.quarry_id, product_id=args.product_id, dry_run=args.dry_run, reason=args.reason
+        )
+        if args.dry_run:
+            for change in result["preview"]:
+                print(
+                    f"  заказ #{change['order_id']}: {change['old_price']} → {change['new_price']}, "
+                    f"{change['old_total']} → {change['new_total']}"
+                )
+            print(f"Изменится заказов: {result['count']}")
+        else:
+            print(
+                f"✅ Пересчитано заказов: {result['count']} за {time.perf_counter() - started:.1f} с "
+                f"(пакет {result['batch_id']})"
+            )
@@ -0,0 +1,153 @@
+# reports.py
+import argparse
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from sqlalchemy import event, func, inspect, select, union_all
+from sqlalchemy.orm import Session
+
+from database import engine, get_db, upsert_insert, utcnow
+from models import ArchivedOrder, DailySales, Order, ProductType, Quarry
+
+# Поля заказа, от которых зависят агрегаты продаж
+SALES_FIELDS = ("created_at", "quarry_id", "product_id", "status", "quantity", "total_price")
+SALES_KEY = ("day", "quarry_id", "product_id", "status")
+
+
+def _sales_key(values):
+    created_at = values["created_at"] or utcnow()
+    return (created_at.date(), values["quarry_id"], values["product_id"], values["status"] or "new")
+
+
+def _current_values(order):
+    return {field: getattr(order, field) for field in SALES_FIELDS}
+
+
+def _previous_values(order):
+    """Значения полей до текущего flush (из истории атрибутов)"""
+    state = inspect(order)
+    values = {}
+    for field in SALES_FIELDS:
+        history = state.attrs[field].history
+        values[field] = history.deleted[0] if history.deleted else getattr(order, field)
+    return values
+
+
+def _add_delta(deltas, values, sign):
+    delta = deltas.setdefault(_sales_key(values), [0, 0.0, Decimal(0)])
+    delta[0] += sign
+    delta[1] += sign * float(values["quantity"] or 0)
+    delta[2] += sign * Decimal(str(values["total_price"] or 0))
+
+
+def apply_sales_deltas(conn, deltas):
+    """Прибавляет изменения {ключ: [заказов, количество, выручка]} к агрегатам"""
+    rows = [
+        dict(zip(SALES_KEY, key), order_count=count, quantity=quantity, revenue=revenue)
+        for key, (count, quantity, revenue) in deltas.items()
+        if count or quantity or revenue
+    ]
+    if not rows:
+        return
+    stmt = upsert_insert(DailySales, conn.dialect.name)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(SALES_KEY),
+        set_={
+            "order_count": DailySales.order_count + stmt.excluded.order_count,
+            "quantity": DailySales.quantity + stmt.excluded.quantity,
+            "revenue": DailySales.revenue + stmt.excluded.revenue,
+        },
+    )
+    conn.execute(stmt, rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _update_sales(session, flush_context):
+    """Переносит изменения заказов в агрегаты в той же транзакции"""
+    deltas = {}
+    for order in session.new:
+        if isinstance(order, Order):
+            _add_delta(deltas, _current_values(order), 1)
+    for order in session.deleted:
+        if isinstance(order, Order):
+            _add_delta(deltas, _previous_values(order), -1)
+    for order in session.dirty:
+        if isinstance(order, Order) and session.is_modified(order):
+            previous = _previous_values(order)
+            current = _current_values(order)
+            if previous != current:
+                _add_delta(deltas, previous, -1)
+                _add_delta(deltas, current, 1)
+    if deltas:
+        apply_sales_deltas(session.connection(), deltas)
+
+
+def rebuild_sales_aggregates(conn=None):
+    """Пересчитывает агрегаты продаж по всем заказам (включая архив) одним INSERT ... SELECT"""
+    if conn is None:
+        with engine.begin() as conn:
+            return rebuild_sales_aggregates(conn)
+    orders = union_all(*(
+        select(model.created_at, model.quarry_id, model.product_id, model.status, model.quantity, model.total_price)
+        .where(model.created_at.is_not(None))
+        for model in (Order, ArchivedOrder)
+    )).subquery()
+    day = func.date(orders.c.created_at)
+    status = func.coalesce(orders.c.status, "new")
+    source = (
+        select(
+            day,
+            orders.c.quarry_id,
+            orders.c.product_id,
+            status,
+            func.count(),
+            func.sum(orders.c.quantity),
+            func.sum(orders.c.total_price),
+        )
+        .group_by(day, orders.c.quarry_id, orders.c.product_id, status)
+    )
+    conn.execute(DailySales.__table__.delete())
+    conn.execute(DailySales.__table__.insert().from_select(
+        ["day", "quarry_id", "product_id", "status", "order_count", "quantity", "revenue"], source
+    ))
+
+
+def sales_dashboard(days=30, exclude_statuses=("cancelled",)):
+    """Данные для панели продаж за последние days дней — только из агрегатов"""
+    since = date.today() - timedelta(days=days - 1)
+    filters = [DailySales.day >= since, DailySales.status.not_in(exclude_statuses)]
+    totals = (
+        func.sum(DailySales.order_count).label("order_count"),
+        func.sum(DailySales.quantity).label("quantity"),
+        func.sum(DailySales.revenue).label("revenue"),
+    )
+    with get_db() as db:
+        by_day = db.execute(
+            select(DailySales.day, *totals)
+            .where(*filters)
+            .group_by(DailySales.day)
+            .order_by(DailySales.day.desc())
+        ).all()
+        by_quarry = db.execute(
+            select(Quarry.name.label("quarry"), ProductType.name.label("product"), *totals)
+            .select_from(DailySales)
+            .join(Quarry, Quarry.id == DailySales.quarry_id)
+            .join(ProductType, ProductType.id == DailySales.product_id)
+            .where(*filters)
+            .group_by(Quarry.name, ProductType.name)
+            .order_by(func.sum(DailySales.revenue).desc())
+        ).all()
+    return {"since": since, "by_day": by_day, "by_quarry": by_quarry}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Агрегаты продаж")
+    parser.add_argument("--rebuild", action="store_true", help="Пересчитать агрегаты по всем заказам")
+    args = parser.parse_args()
+    if args.rebuild:
+        started = time.perf_counter()
+        rebuild_sales_aggregates()
+        print(f"✅ Агрегаты продаж пересчитаны за {time.perf_counter() - started:.1f} с")
+    else:
+        parser.print_help()
@@ -1,5 +1,17 @@
-from database import get_db
+import argparse
+import random
+import time
+from bisect import bisect
+from itertools import accumulate, combinations, islice
+
+from sqlalchemy import delete, insert
+
+from database import SQLITE_PRAGMAS, create_tables, engine, get_db
+from reports import rebuild_sales_aggregates
+from search import drop_search_triggers, install_search
+from versions import bump_model_version
 from models import (
+    ORDER_STATUSES,
     ProductCategory, 
     ProductType, 
     Quarry, 
@@ -7,13 +19,54 @@ from models import (
     Customer, 
     Order,
     OrderTruck,
-    TruckType
+    OrderPriceAudit,
+    TruckType,
+    ArchivedOrder,
+    ArchivedOrderTruck
 )
 from datetime import datetime, timedelta
 
+# Размер набора данных при scale=1.0
+BASE_COUNTS = {
+    "categories": 10,
+    "products": 200,
+    "quarries": 100,
+    "customers": 100_000,
+    "orders": 1_000_000,
+}
+
+# Наименьший размер справочников при малом scale: заказы расходятся по разным товарам и карьерам
+MIN_COUNTS = {
+    "categories": 4,
+    "products": 20,
+    "quarries": 10,
+}
+
+# Таблицы в порядке удаления (сначала зависимые)
+GENERATED_MODELS = [
+    ArchivedOrderTruck, ArchivedOrder, OrderPriceAudit, OrderTruck, Order, TruckType, Customer, QuarryProductPrice, Quarry, ProductType, ProductCategory
+]
+
+# Большие таблицы: их вторичные индексы на время загрузки удаляются
+BULK_LOADED_MODELS = [Customer, Order, OrderTruck]
+
+TRUCK_TYPES = [
+    ("Самосвал 10м³", 10.0, 10.0, "Малый самосвал"),
+    ("Самосвал 20м³", 20.0, 20.0, "Средний самосвал"),
+    ("Самосвал 30м³", 30.0, 30.0, "Крупный самосвал"),
+    ("Самосвал 40м³", 40.0, 40.0, "Очень крупный самосвал"),
+    ("Мегасамосвал 50м³", 50.0, 50.0, "Самый большой самосвал"),
+]
+
+# Доли статусов в порядке models.ORDER_STATUSES
+ORDER_STATUS_WEIGHTS = [10, 15, 70, 5]
+
 def seed_data():
     with get_db() as db:
         # Очищаем базу данных перед заполнением
+        db.query(ArchivedOrderTruck).delete()
+        db.query(ArchivedOrder).delete()
+        db.query(OrderPriceAudit).delete()
         db.query(OrderTruck).delete()
         db.query(Order).delete()
         db.query(TruckType).delete()
@@ -135,7 +188,203 @@ def seed_data():
         db.add_all(order_trucks)
         
         db.commit()
-        print("✅ Тестовые данные успешно добавлены в базу данных!")
+    # Очистка выше идет мимо ORM-событий, поэтому агрегаты продаж пересчитываем целиком
+    rebuild_sales_aggregates()
+    print("✅ Тестовые данные успешно добавлены в базу данных!")
+
+def _insert_chunks(conn, model, columns, rows, chunk_size):
+    """
+    Вставляет кортежи значений columns пачками через executemany драйвера:
+    без компиляции и обработки параметров SQLAlchemy для каждой строки
+    """
+    preparer = conn.dialect.identifier_preparer
+    placeholder = "?" if conn.dialect.paramstyle == "qmark" else "%s"
+    sql = (
+        f"INSERT INTO {preparer.format_table(model.__table__)} "
+        f"({', '.join(preparer.quote(column) for column in columns)}) "
+        f"VALUES ({', '.join([placeholder] * len(columns))})"
+    )
+    rows = iter(rows)
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        conn.exec_driver_sql(sql, chunk)
+
+
+def generate_data(scale=1.0, seed=42, chunk_size=20_000, counts=None):
+    """
+    Генерирует синтетический набор данных для нагрузочного тестирования.
+    
+    Количество записей задается BASE_COUNTS, умноженным на scale
+    (справочники растут медленнее заказов и не меньше MIN_COUNTS);
+    counts — явное количество для отдельных таблиц, например {"orders": 50_000}.
+    Одинаковые параметры и seed всегда дают одинаковый набор данных.
+    Возвращает словарь с количеством вставленных записей по таблицам.
+    """
+    rnd = random.Random(seed)
+    counts = {
+        **{
+            name: max(MIN_COUNTS.get(name, 1), round(base * (min(scale, 1) if name in MIN_COUNTS else scale)))
+            for name, base in BASE_COUNTS.items()
+        },
+        **(counts or {}),
+    }
+    unknown = sorted(set(counts) - set(BASE_COUNTS))
+    if unknown:
+        raise ValueError(f"Неизвестные таблицы: {', '.join(unknown)}")
+    if any(count < 1 for count in counts.values()):
+        raise ValueError("Количество записей должно быть не меньше 1")
+    now = datetime.now().replace(microsecond=0)
+    started = time.perf_counter()
+
+    create_tables()
+    # Индексы строятся по готовым данным один раз, а не обновляются на каждой строке
+    indexes = [index for model in BULK_LOADED_MODELS for index in model.__table__.indexes]
+    with engine.connect() as conn:
+        sqlite = conn.dialect.name == "sqlite"
+        if sqlite:
+            # Данные одноразовые: не ждем fsync на каждой пачке
+            conn.exec_driver_sql("PRAGMA synchronous=OFF")
+            conn.commit()
+        with conn.begin():
+            had_search = drop_search_triggers(conn)
+            for index in indexes:
+                index.drop(conn, checkfirst=True)
+        try:
+            with conn.begin():
+                for model in GENERATED_MODELS:
+                    conn.execute(delete(model))
+
+                conn.execute(insert(ProductCategory), [
+                    {"id": i, "name": f"Категория {i}"} for i in range(1, counts["categories"] + 1)
+                ])
+                units = {}
+                product_rows = []
+                for i in range(1, counts["products"] + 1):
+                    units[i] = rnd.choice(["тонна", "м³"])
+                    product_rows.append({
+                        "id": i,
+                        "name": f"Товар {i}",
+                        "category_id": rnd.randint(1, counts["categories"]),
+                        "base_unit": units[i],
+                    })
+                conn.execute(insert(ProductType), product_rows)
+                conn.execute(insert(Quarry), [
+                    {"id": i, "name": f"Карьер {i}", "location": f"Поселок {i}", "is_active": rnd.random() > 0.1}
+                    for i in range(1, counts["quarries"] + 1)
+                ])
+
+                # Каждый карьер продает случайное подмножество товаров
+                price_rows = []
+                for quarry_id in range(1, counts["quarries"] + 1):
+                    sample_size = min(counts["products"], rnd.randint(3, 20))
+                    for product_id in rnd.sample(range(1, counts["products"] + 1), sample_size):
+                        price_rows.append({
+                            "id": len(price_rows) + 1,
+                            "quarry_id": quarry_id,
+                            "product_id": product_id,
+                            "price": round(rnd.uniform(500, 3000), 2),
+                            "updated_at": now,
+                        })
+                conn.execute(insert(QuarryProductPrice), price_rows)
+
+                conn.execute(insert(TruckType), [
+                    {"id": i, "name": name, "volume": volume, "load_capacity": capacity, "description": description}
+                    for i, (name, volume, capacity, description) in enumerate(TRUCK_TYPES, start=1)
+                ])
+
+                _insert_chunks(conn, Customer, (
+                    "id", "full_name", "phone", "email", "address", "phone_normalized", "email_normalized",
+                ), (
+                    (
+                        i,
+                        f"Клиент {i}",
+                        f"+79{i:09d}",
+                        f"client{i}@example.com",
+                        f"г. Москва, ул. Тестовая, д. {i}",
+                        f"79{i:09d}",
+                        f"client{i}@example.com",
+                    )
+                    for i in range(1, counts["customers"] + 1)
+                ), chunk_size)
+
+                # В циклах по заказам — rnd.random() вместо randint/choices/sample: они в разы медленнее
+                random_ = rnd.random
+                status_bounds = list(accumulate(ORDER_STATUS_WEIGHTS))
+                truck_sets = [
+                    combination for size in (2, 3)
+                    for combination in combinations(range(1, len(TRUCK_TYPES) + 1), size)
+                ]
+                customers = counts["customers"]
+                prices = len(price_rows)
+                period = 365 * 24 * 3600
+
+                def orders():
+                    for i in range(1, counts["orders"] + 1):
+                        price = price_rows[int(random_() * prices)]
+                        quantity = float(10 + int(random_() * 291))
+                        # Дата в формате, который пишет БД (как у заказов из админки)
+                        created_at = (now - timedelta(seconds=int(random_() * period))).isoformat(" ")
+                        yield (
+                            i,
+                            1 + int(random_() * customers),
+                            created_at,
+                            ORDER_STATUSES[bisect(status_bounds, random_() * status_bounds[-1])],
+                            round(quantity * price["price"], 2),
+                            f"Объект {i}",
+                            price["product_id"],
+                            price["quarry_id"],
+                            quantity,
+                            price["price"],
+                        )
+
+                _insert_chunks(conn, Order, (
+                    "id", "customer_id", "created_at", "status", "total_price", "delivery_address",
+                    "product_id", "quarry_id", "quantity", "price_per_unit",
+                ), orders(), chunk_size)
+
+                def order_trucks():
+                    truck_id = 0
+                    for order_id in range(1, counts["orders"] + 1):
+                        for truck_type_id in truck_sets[int(random_() * len(truck_sets))]:
+                            truck_id += 1
+                            yield truck_id, order_id, truck_type_id, 1 + int(random_() * 3)
+
+                _insert_chunks(conn, OrderTruck, ("id", "order_id", "truck_type_id", "count"), order_trucks(), chunk_size)
+                rebuild_sales_aggregates(conn)
+                # Данные заменены мимо ORM: кеши справочников и матрица цен должны перечитаться
+                for model in GENERATED_MODELS:
+                    bump_model_version(conn, model.__tablename__)
+        finally:
+            # И после ошибки: загрузка откатилась, а индексы и триггеры уже удалены
+            with conn.begin():
+                for index in indexes:
+                    index.create(conn, checkfirst=True)
+                if had_search:
+                    install_search(conn)
+            if sqlite:
+                # Соединение вернется в пул: остальным нужна обычная надежность записи
+                conn.exec_driver_sql(f"PRAGMA synchronous={SQLITE_PRAGMAS['synchronous']}")
+                conn.commit()
+
+    counts["prices"] = len(price_rows)
+    print(f"✅ Синтетические данные сгенерированы за {time.perf_counter() - started:.1f} с: {counts}")
+    return counts
+
 
 if __name__ == "__main__":
-    seed_data()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Заполнение БД тестовыми данными")
+    parser.add_argument("--scale", type=float, help="Масштаб синтетических данных (1.0 = 1 млн заказов)")
+    parser.add_argument("--seed", type=int, default=42, help="Зерно генератора случайных чисел")
+    parser.add_argument("--chunk-size", type=int, default=20_000, help="Строк в одной пачке вставки")
+    for name in BASE_COUNTS:
+        parser.add_argument(f"--{name}", type=int, help=f"Количество записей {name} (вместо рассчитанного по --scale)")
+    args = parser.parse_args()
+    counts = {name: getattr(args, name) for name in BASE_COUNTS if getattr(args, name) is not None}
+    if args.scale is None and not counts:
+        seed_data()
+    else:
+        generate_data(
+            scale=1.0 if args.scale is None else args.scale,
+            seed=args.seed,
+            chunk_size=args.chunk_size,
+            counts=counts,
+        )
\ No newline at end of file
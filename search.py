@@ -0,0 +1,177 @@
+# search.py
+import logging
+import re
+
+from sqlalchemy import column, literal_column, or_, select, table, text, union
+from sqlalchemy.exc import OperationalError
+
+from database import engine
+from models import Customer, ProductType, Quarry, normalize_email
+
+logger = logging.getLogger(__name__)
+
+# Полнотекстовый индекс клиентов в SQLite (триграммы дают поиск по подстроке, как LIKE)
+CUSTOMER_FTS = "customer_fts"
+FTS_MIN_TERM_LENGTH = 3
+
+# Строка поиска похожа на телефон: цифры и разделители, не меньше PHONE_MIN_DIGITS цифр
+PHONE_TERM = re.compile(r"\+?[\d\s()\-]+")
+PHONE_MIN_DIGITS = 3
+_NON_DIGITS = re.compile(r"\D")
+
+SQLITE_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {CUSTOMER_FTS} USING fts5(
+        full_name, phone, email, content='customer', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {CUSTOMER_FTS}_ai AFTER INSERT ON customer BEGIN
+        INSERT INTO {CUSTOMER_FTS}(rowid, full_name, phone, email)
+        VALUES (new.id, new.full_name, new.phone, new.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {CUSTOMER_FTS}_ad AFTER DELETE ON customer BEGIN
+        INSERT INTO {CUSTOMER_FTS}({CUSTOMER_FTS}, rowid, full_name, phone, email)
+        VALUES ('delete', old.id, old.full_name, old.phone, old.email);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {CUSTOMER_FTS}_au AFTER UPDATE ON customer BEGIN
+        INSERT INTO {CUSTOMER_FTS}({CUSTOMER_FTS}, rowid, full_name, phone, email)
+        VALUES ('delete', old.id, old.full_name, old.phone, old.email);
+        INSERT INTO {CUSTOMER_FTS}(rowid, full_name, phone, email)
+        VALUES (new.id, new.full_name, new.phone, new.email);
+    END""",
+    f"INSERT INTO {CUSTOMER_FTS}({CUSTOMER_FTS}) VALUES ('rebuild')",
+]
+
+# В PostgreSQL ILIKE '%...%' ускоряется триграммными GIN-индексами
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_customer_full_name_trgm ON customer USING gin (full_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_phone_trgm ON customer USING gin (phone gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_customer_email_trgm ON customer USING gin (email gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_producttype_name_trgm ON producttype USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_quarry_name_trgm ON quarry USING gin (name gin_trgm_ops)",
+]
+
+_fts_table = table(CUSTOMER_FTS, column("rowid"))
+_fts_available = None
+
+
+def install_search(conn):
+    """Создает поисковые индексы и триггеры синхронизации для текущей БД"""
+    global _fts_available
+    if conn.dialect.name == "sqlite":
+        try:
+            for ddl in SQLITE_FTS_DDL:
+                conn.execute(text(ddl))
+            _fts_available = True
+        except OperationalError as e:
+            # SQLite без FTS5 или без триграммного токенизатора (старше 3.34)
+            logger.warning("Полнотекстовый поиск недоступен: %s", e)
+            _fts_available = False
+    elif conn.dialect.name == "postgresql":
+        for ddl in POSTGRES_TRGM_DDL:
+            conn.execute(text(ddl))
+
+
+def drop_search_triggers(conn):
+    """
+    Удаляет триггеры синхронизации полнотекстового индекса клиентов перед
+    массовой загрузкой. Возвращает True, если они были: тогда после загрузки
+    install_search(conn) создает их заново и перестраивает индекс один раз.
+    """
+    if conn.dialect.name != "sqlite":
+        return False
+    triggers = conn.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE :prefix"),
+        {"prefix": f"{CUSTOMER_FTS}_%"},
+    ).scalars().all()
+    for trigger in triggers:
+        conn.execute(text(f'DROP TRIGGER "{trigger}"'))
+    return bool(triggers)
+
+
+def fts_available():
+    """Есть ли в БД полнотекстовый индекс клиентов (проверяется один раз)"""
+    global _fts_available
+    if _fts_available is None:
+        if engine.dialect.name != "sqlite":
+            _fts_available = False
+        else:
+            with engine.connect() as conn:
+                _fts_available = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE name = :name"), {"name": CUSTOMER_FTS}
+                ).first() is not None
+    return _fts_available
+
+
+def _like(term):
+    return f"%{term}%"
+
+
+def _prefix(column_, prefix):
+    """Условие «начинается с prefix» диапазоном по индексу (без LIKE и его правил регистра)"""
+    return column_.between(prefix, prefix + "\uffff")
+
+
+def phone_prefix(term):
+    """Начало нормализованного телефона по тому, что ввел оператор: «8 900» -> «7900»"""
+    digits = _NON_DIGITS.sub("", term)
+    if digits[:1] in ("8", "9"):
+        digits = "7" + (digits[1:] if digits[0] == "8" else digits)
+    return digits
+
+
+def customer_ids_by_contact(term):
+    """
+    Подзапрос id клиентов по префиксу нормализованного телефона или email
+    (индексный диапазон) или None, если строка не похожа на телефон или email.
+    """
+    if PHONE_TERM.fullmatch(term) and len(_NON_DIGITS.sub("", term)) >= PHONE_MIN_DIGITS:
+        return select(Customer.id).where(_prefix(Customer.phone_normalized, phone_prefix(term)))
+    if "@" in term:
+        return select(Customer.id).where(_prefix(Customer.email_normalized, normalize_email(term)))
+    return None
+
+
+def _customer_ids_by_substring(term):
+    if len(term) >= FTS_MIN_TERM_LENGTH and fts_available():
+        phrase = '"' + term.replace('"', '""') + '"'
+        return select(_fts_table.c.rowid).where(
+            literal_column(CUSTOMER_FTS).op("MATCH")(phrase)
+        )
+    return select(Customer.id).where(or_(
+        Customer.full_name.ilike(_like(term)),
+        Customer.phone.ilike(_like(term)),
+        Customer.email.ilike(_like(term)),
+    ))
+
+
+def customer_ids_matching(term):
+    """
+    Подзапрос id клиентов для поиска в списках админки: подстрока ФИО,
+    телефона или email, а для телефона и email — еще и префикс
+    нормализованных колонок («8 900 123» находит «+7 (900) 123-...»).
+    """
+    term = term.strip()
+    by_substring = _customer_ids_by_substring(term)
+    by_contact = customer_ids_by_contact(term)
+    return by_substring if by_contact is None else union(by_contact, by_substring)
+
+
+def customer_ids_lookup(term):
+    """
+    Подзапрос id клиентов для автодополнения: телефон и email — только
+    по префиксу нормализованных колонок, остальное — по подстроке ФИО,
+    телефона или email.
+    """
+    term = term.strip()
+    by_contact = customer_ids_by_contact(term)
+    return by_contact if by_contact is not None else _customer_ids_by_substring(term)
+
+
+def product_ids_matching(term):
+    """Подзапрос id видов товара по подстроке названия (справочник небольшой)"""
+    return select(ProductType.id).where(ProductType.name.ilike(_like(term)))
+
+
+def quarry_ids_matching(term):
+    """Подзапрос id карьеров по подстроке названия (справочник небольшой)"""
+    return select(Quarry.id).where(Quarry.name.ilike(_like(term)))
@@ -0,0 +1,223 @@
+# startup.py
+import logging
+import os
+from contextlib import contextmanager
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import SQLAlchemyError
+
+from database import SCHEMA_VERSION, Base, create_tables, engine, get_db
+
+logger = logging.getLogger(__name__)
+
+# Файл блокировки, через который воркеры uvicorn договариваются, кто выполняет настройку
+STARTUP_LOCK_PATH = os.getenv("STARTUP_LOCK_PATH", "./.startup.lock")
+
+# SEED_DATA=1 — заполнить пустую БД демонстрационными данными при старте
+SEED_ON_STARTUP = os.getenv("SEED_DATA") == "1"
+
+# Ключ advisory-блокировки PostgreSQL
+ADVISORY_LOCK_KEY = 7_340_021
+
+
+@contextmanager
+def startup_lock():
+    """
+    Межпроцессная блокировка на время настройки БД.
+    Для PostgreSQL используется advisory lock (работает между хостами),
+    для остальных БД — файловая блокировка.
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        return
+
+    with open(STARTUP_LOCK_PATH, "a+b") as lock_file:
+        try:
+            import fcntl
+        except ImportError:  # Windows
+            import msvcrt
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def current_schema_version():
+    """Версия схемы, записанная в БД, или None для новой БД"""
+    from models import SchemaVersion
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(SchemaVersion.version)).scalar()
+    except SQLAlchemyError:
+        return None
+
+
+def _renumber_reused_ids(conn, table, archive_table, references=()):
+    """
+    Дает новые id строкам table, чей id уже занят в архиве (SQLite без
+    AUTOINCREMENT выдал его повторно); references — [(таблица, колонка)]
+    со ссылками на эти id. Возвращает число перенумерованных строк.
+    """
+    reused = [row[0] for row in conn.exec_driver_sql(
+        f'SELECT id FROM "{table}" WHERE id IN (SELECT id FROM "{archive_table}") ORDER BY id'
+    )]
+    if not reused:
+        return 0
+    next_id = conn.exec_driver_sql(
+        f'SELECT max(coalesce((SELECT max(id) FROM "{table}"), 0), '
+        f'coalesce((SELECT max(id) FROM "{archive_table}"), 0))'
+    ).scalar()
+    for old_id in reused:
+        next_id += 1
+        for ref_table, ref_column, extra in references:
+            conn.exec_driver_sql(
+                f'UPDATE "{ref_table}" SET "{ref_column}" = ? WHERE "{ref_column}" = ?{extra}',
+                (next_id, old_id) + ((old_id,) if extra else ()),
+            )
+        conn.exec_driver_sql(f'UPDATE "{table}" SET id = ? WHERE id = ?', (next_id, old_id))
+    logger.warning("Таблица %s: id, повторно выданные после архивирования, заменены новыми: %s", table, reused)
+    return len(reused)
+
+
+def rebuild_sqlite_autoincrement():
+    """
+    Пересоздает в SQLite таблицы order и ordertruck с AUTOINCREMENT, если они
+    созданы без него: иначе SQLite выдает id архивных строк повторно.
+    Строки, уже получившие такие id, перенумеровываются.
+    """
+    from models import ArchivedOrder, ArchivedOrderTruck, Order, OrderPriceAudit, OrderTruck
+
+    if engine.dialect.name != "sqlite":
+        return
+    tables = [(OrderTruck.__table__, ArchivedOrderTruck.__tablename__), (Order.__table__, ArchivedOrder.__tablename__)]
+    with engine.connect() as conn:
+        ddl = dict(conn.exec_driver_sql("SELECT name, sql FROM sqlite_master WHERE type = 'table'").all())
+        tables = [(table, archive) for table, archive in tables if "AUTOINCREMENT" not in (ddl.get(table.name) or "").upper()]
+        if not tables:
+            return
+        conn.commit()
+        # Без внешних ключей DROP не каскадирует удаление машин, а RENAME не переписывает ссылки на таблицу
+        conn.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        conn.exec_driver_sql("PRAGMA legacy_alter_table=ON")
+        try:
+            conn.exec_driver_sql("BEGIN")
+            for table, archive in tables:
+                if archive in ddl:
+                    references = [("ordertruck", "order_id", ""), (
+                        OrderPriceAudit.__tablename__, "order_id",
+                        ' AND changed_at >= (SELECT created_at FROM "order" WHERE id = ?)',
+                    )] if table.name == Order.__tablename__ else []
+                    _renumber_reused_ids(conn, table.name, archive, references)
+                old_name = f"{table.name}_without_autoincrement"
+                conn.exec_driver_sql(f'ALTER TABLE "{table.name}" RENAME TO "{old_name}"')
+                for (index,) in conn.exec_driver_sql(
+                    "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                    (old_name,),
+                ).all():
+                    conn.exec_driver_sql(f'DROP INDEX "{index}"')
+                table.create(conn)
+                columns = ", ".join(f'"{column.name}"' for column in table.columns)
+                conn.exec_driver_sql(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{old_name}"')
+                conn.exec_driver_sql(f'DROP TABLE "{old_name}"')
+                # Новые id — больше всех выданных, в том числе перенесенных в архив
+                if archive in ddl:
+                    conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = ?", (table.name,))
+                    conn.exec_driver_sql(
+                        f'INSERT INTO sqlite_sequence (name, seq) SELECT ?, max('
+                        f'coalesce((SELECT max(id) FROM "{table.name}"), 0), '
+                        f'coalesce((SELECT max(id) FROM "{archive}"), 0))',
+                        (table.name,),
+                    )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.exec_driver_sql("PRAGMA legacy_alter_table=OFF")
+            conn.exec_driver_sql("PRAGMA foreign_keys=ON")
+            conn.commit()
+    logger.info("Таблицы пересозданы с AUTOINCREMENT: %s", ", ".join(table.name for table, _ in tables))
+
+
+def upgrade_schema():
+    """
+    Приводит схему БД к моделям без потери данных:
+    создает недостающие таблицы, nullable-колонки, индексы и поисковые индексы,
+    заполняет вычисляемые колонки существующих строк.
+    """
+    from customers import backfill_normalized_contacts
+    from models import DailySales, SchemaVersion
+    from reports import rebuild_sales_aggregates
+    from search import install_search
+
+    new_tables = {table.name for table in Base.metadata.sorted_tables} - set(inspect(engine).get_table_names())
+    create_tables()
+    rebuild_sqlite_autoincrement()
+    with engine.begin() as conn:
+        inspector = inspect(conn)
+        preparer = conn.dialect.identifier_preparer
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                if not column.nullable:
+                    logger.warning("Колонку %s.%s нужно добавить вручную", table.name, column.name)
+                    continue
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.format_table(table)} "
+                    f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(conn.dialect)}"
+                ))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+        install_search(conn)
+        backfill_normalized_contacts(conn)
+        if DailySales.__tablename__ in new_tables:
+            rebuild_sales_aggregates(conn)
+
+        conn.execute(SchemaVersion.__table__.delete())
+        conn.execute(SchemaVersion.__table__.insert().values(id=1, version=SCHEMA_VERSION))
+    logger.info("Схема БД обновлена до версии %s", SCHEMA_VERSION)
+
+
+def seed_if_empty():
+    """Заполняет демонстрационными данными только пустую БД"""
+    from models import Order
+    from scipt import seed_data
+
+    with get_db() as db:
+        if db.execute(select(Order.id).limit(1)).first():
+            return
+    seed_data()
+
+
+def bootstrap():
+    """
+    Подготовка БД при старте приложения.
+
+    Если схема актуальна и заполнение не запрошено, выполняется один
+    короткий запрос без блокировок — время старта не зависит от объема данных.
+    Иначе настройку под блокировкой выполняет ровно один воркер,
+    остальные дожидаются ее окончания и ничего не повторяют.
+    """
+    if current_schema_version() == SCHEMA_VERSION and not SEED_ON_STARTUP:
+        return
+    with startup_lock():
+        if current_schema_version() != SCHEMA_VERSION:
+            upgrade_schema()
+        if SEED_ON_STARTUP:
+            seed_if_empty()
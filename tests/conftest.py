@@ -0,0 +1,49 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+import time
+
+import pytest
+
+# Приложение читает настройки БД при импорте: отдельная БД задается до импорта модулей
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_database_dir = tempfile.mkdtemp(prefix="admin_tests_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+os.environ["STARTUP_LOCK_PATH"] = os.path.join(_database_dir, "startup.lock")
+# Фоновые задачи — в потоках, без дочерних процессов
+os.environ["JOB_PROCESSES"] = "0"
+for name in ("ASYNC_DATABASE_URL", "DB_ASYNC", "DATABASE_REPLICA_URL", "SEED_DATA"):
+    os.environ.pop(name, None)
+sys.path.insert(0, ROOT)
+# Шаблоны админки ищутся относительно рабочего каталога
+os.chdir(ROOT)
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Клиент приложения с демонстрационными данными (lifespan: схема БД и пулы задач)"""
+    from fastapi.testclient import TestClient
+
+    from main import app
+    from scipt import seed_data
+
+    with TestClient(app) as client:
+        seed_data()
+        yield client
+
+
+@pytest.fixture
+def wait_job():
+    """wait_job(id) — состояние фоновой задачи после ее завершения"""
+    from jobs import job_info
+
+    def wait(job_id, timeout=10):
+        deadline = time.monotonic() + timeout
+        while True:
+            info = job_info(job_id)
+            if info["status"] in ("done", "failed") or time.monotonic() > deadline:
+                return info
+            time.sleep(0.05)
+
+    return wait
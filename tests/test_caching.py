@@ -0,0 +1,42 @@
+from sqlalchemy import select
+
+from database import get_db
+from models import ProductType, QuarryProductPrice
+
+
+def _conditional_get(client, url, change):
+    """Ответ на условный GET после change(db): ETag снят до изменения"""
+    first = client.get(url)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    with get_db() as db:
+        change(db)
+        db.commit()
+    return client.get(url, headers={"If-None-Match": etag})
+
+
+def test_quarry_details_follow_price_changes(client):
+    with get_db() as db:
+        price_id, quarry_id = db.execute(select(QuarryProductPrice.id, QuarryProductPrice.quarry_id)).first()
+
+    def change(db):
+        db.get(QuarryProductPrice, price_id).price = 4321.5
+
+    response = _conditional_get(client, f"/admin/quarry/details/{quarry_id}", change)
+    assert response.status_code == 200
+    assert "4321.50" in response.text
+
+
+def test_category_details_follow_product_renames(client):
+    with get_db() as db:
+        product_id, category_id = db.execute(
+            select(ProductType.id, ProductType.category_id).where(ProductType.category_id.is_not(None))
+        ).first()
+
+    def change(db):
+        db.get(ProductType, product_id).name = "Щебень переименованный"
+
+    response = _conditional_get(client, f"/admin/product-category/details/{category_id}", change)
+    assert response.status_code == 200
+    assert "Щебень переименованный" in response.text
@@ -0,0 +1,38 @@
+from database import get_db
+from jobs import dedup_customers
+from models import Customer
+
+
+def _add_customers(phone, count):
+    with get_db() as db:
+        customers = [
+            Customer(full_name=f"Клиент {phone}", phone=phone, email=f"{phone}@example.com", address="Адрес")
+            for _ in range(count)
+        ]
+        db.add_all(customers)
+        db.commit()
+        return [customer.id for customer in customers]
+
+
+def _existing(ids):
+    with get_db() as db:
+        return sorted(customer_id for customer_id in ids if db.get(Customer, customer_id) is not None)
+
+
+def _merge(groups):
+    return dedup_customers(lambda *args: None, dry_run=False, groups=groups)
+
+
+def test_merge_reviewed_group(client):
+    reviewed = _add_customers("+7 900 555-00-01", 2)
+    result = _merge([reviewed])
+    assert result["merged"] == 1
+    assert _existing(reviewed) == reviewed[:1]
+
+
+def test_merge_skips_group_changed_after_review(client):
+    reviewed = _add_customers("+7 900 555-00-02", 2)
+    late = _add_customers("+7 900 555-00-02", 1)
+    result = _merge([reviewed])
+    assert result == {"groups": 0, "merged": 0, "skipped": 1}
+    assert _existing(reviewed + late) == sorted(reviewed + late)
@@ -0,0 +1,31 @@
+import pytest
+
+
+@pytest.mark.parametrize("params", [
+    {"days": 0},
+    {"days": -30},
+    {"days": "180"},
+    {"days": None},
+    {"batch_size": 0},
+    {"days": 180, "batch_size": 1.5},
+])
+def test_archive_rejects_invalid_parameters(client, params):
+    assert client.post("/api/jobs/archive", json=params).status_code == 422
+
+
+@pytest.mark.parametrize("params", [
+    {"order_ids": "12", "status": "completed"},
+    {"order_ids": [1, True], "status": "completed"},
+    {"order_ids": [1], "status": "x" * 30},
+    {"order_ids": [1], "status": "completed", "batch_size": 0},
+])
+def test_set_status_rejects_invalid_parameters(client, params):
+    assert client.post("/api/jobs/set_status", json=params).status_code == 422
+
+
+def test_reprice_post_enqueues_job(client, wait_job):
+    response = client.post("/api/prices/reprice", params={"reason": "тест"})
+    assert response.status_code == 202
+    job = wait_job(response.json()["id"])
+    assert job["name"] == "reprice"
+    assert job["status"] == "done"
@@ -0,0 +1,59 @@
+import html
+import re
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select
+
+from admin import ArchivedOrderAdmin
+from database import get_db
+from models import ArchivedOrder, Order
+
+ROW_LINK = re.compile(rf"/admin/{ArchivedOrderAdmin.identity}/details/(\d+)")
+
+
+@pytest.fixture
+def archived_ids(client):
+    """25 архивных заказов, у 10 из них created_at пустой"""
+    with get_db() as db:
+        order = db.execute(select(Order).order_by(Order.id)).scalars().first()
+        start = 1_000_000
+        ids = list(range(start, start + 25))
+        db.add_all(
+            ArchivedOrder(
+                id=order_id,
+                created_at=None if order_id % 5 < 2 else datetime(2020, 1, 1) + timedelta(hours=order_id - start),
+                status="completed",
+                total_price=order.total_price,
+                delivery_address=order.delivery_address,
+                product_id=order.product_id,
+                quarry_id=order.quarry_id,
+                quantity=order.quantity,
+                price_per_unit=order.price_per_unit,
+            )
+            for order_id in ids
+        )
+        db.commit()
+    yield ids
+    with get_db() as db:
+        db.execute(delete(ArchivedOrder).where(ArchivedOrder.id.in_(ids)))
+        db.commit()
+
+
+def _walk(client, url):
+    """id строк со всех страниц, переходя по ссылкам «следующая страница» с курсором"""
+    seen = []
+    for page in range(2, 10):
+        text = client.get(url).text
+        seen += [int(row_id) for row_id in ROW_LINK.findall(text)]
+        next_links = re.findall(rf'href="([^"]*(?:\?|&amp;)page={page}[^"]*after=[^"]*)"', text)
+        if not next_links:
+            return seen
+        url = html.unescape(next_links[0])
+    return seen
+
+
+@pytest.mark.parametrize("query", ["", "&sortBy=created_at&sort=asc"])
+def test_keyset_pages_include_null_keys(client, archived_ids, query):
+    seen = _walk(client, f"/admin/{ArchivedOrderAdmin.identity}/list?pageSize=10{query}")
+    assert sorted(seen) == archived_ids
@@ -0,0 +1,26 @@
+import pytest
+from sqlalchemy import select
+
+from admin import OrderAdmin
+from database import count_queries, get_db
+from models import Order
+
+
+@pytest.fixture
+def order_id(client):
+    with get_db() as db:
+        return db.execute(select(Order.id).order_by(Order.id)).scalar()
+
+
+@pytest.mark.parametrize("page, budget", [
+    ("list", OrderAdmin.list_query_budget),
+    ("list?search=Иванов", OrderAdmin.list_query_budget),
+    ("list?sortBy=quantity&sort=desc", OrderAdmin.list_query_budget),
+    ("details/{id}", OrderAdmin.details_query_budget),
+    ("edit/{id}", OrderAdmin.edit_query_budget),
+])
+def test_order_pages_fit_query_budget(client, order_id, page, budget):
+    with count_queries() as counter:
+        response = client.get(f"/admin/order/{page.format(id=order_id)}")
+    assert response.status_code == 200
+    assert counter.count <= budget, f"{page}: {counter.count} SQL-запросов при бюджете {budget}"
@@ -0,0 +1,250 @@
+# trucks.py
+import argparse
+import math
+import os
+import threading
+import time
+
+from fastapi import APIRouter, HTTPException, Query
+from sqlalchemy import delete, insert, select
+
+from database import get_db
+from models import OPEN_STATUSES, VOLUME_UNITS, Order, OrderTruck, ProductType, TruckType
+from versions import get_model_version, on_tables_committed, track_model_versions
+
+TRUCK_VERSION_NAME = TruckType.__tablename__
+track_model_versions(TRUCK_VERSION_NAME)
+
+# Наибольшее количество товара в одном заказе, для которого подбираются машины:
+# таблица динамики растет линейно с количеством
+PLAN_MAX_QUANTITY = int(os.getenv("PLAN_MAX_QUANTITY", "100000"))
+
+# Как часто (сек) сверять версию справочника типов машин с БД
+PLANNER_CHECK_INTERVAL = float(os.getenv("PLANNER_CHECK_INTERVAL", "5"))
+
+
+class TruckPlanner:
+    """
+    Подбор машин для заказа: минимальное количество машин, суммарная
+    вместимость которых не меньше количества товара (при равенстве —
+    с наименьшим недогрузом).
+
+    Для каждого режима (объем/грузоподъемность) динамика по вместимости
+    строится один раз до максимального количества и затем дает ответ
+    для любого заказа за O(1), поэтому пакетный подбор для тысяч заказов
+    не решает задачу заново. Вместимости округляются вниз, количество вверх,
+    до целых единиц.
+    """
+
+    def __init__(self, truck_types):
+        self.truck_types = [(t.id, t.name, t.volume, t.load_capacity) for t in truck_types]
+        self._tables = {}
+
+    def _capacities(self, by_volume):
+        """[(truck_type_id, вместимость в целых единицах)]"""
+        capacities = []
+        for truck_id, _, volume, load_capacity in self.truck_types:
+            capacity = int(math.floor(volume if by_volume else load_capacity))
+            if capacity >= 1:
+                capacities.append((truck_id, capacity))
+        return capacities
+
+    def _table(self, by_volume, quantity):
+        """Таблица решений, покрывающая количество quantity"""
+        table = self._tables.get(by_volume)
+        if table is not None and table["limit"] >= quantity:
+            return table
+
+        capacities = self._capacities(by_volume)
+        if not capacities:
+            raise ValueError("Нет типов машин с ненулевой вместимостью")
+        # Таблицу строим с запасом, чтобы не пересчитывать при чуть большем заказе
+        limit = max(quantity, table["limit"] * 2 if table else 0, 1000)
+        top = limit + max(capacity for _, capacity in capacities)
+
+        # trucks[c] — минимум машин с суммарной вместимостью ровно c, last[c] — тип последней машины
+        infinity = float("inf")
+        trucks = [infinity] * (top + 1)
+        last = [None] * (top + 1)
+        trucks[0] = 0
+        for total in range(1, top + 1):
+            for truck_id, capacity in capacities:
+                if capacity <= total and trucks[total - capacity] + 1 < trucks[total]:
+                    trucks[total] = trucks[total - capacity] + 1
+                    last[total] = (truck_id, capacity)
+
+        # best[q] — лучшая достижимая вместимость c >= q (меньше машин, затем меньше c)
+        best = [None] * (top + 1)
+        for total in range(top, -1, -1):
+            candidate = total if trucks[total] != infinity else None
+            following = best[total + 1] if total < top else None
+            if candidate is None or (following is not None and trucks[following] < trucks[candidate]):
+                candidate = following
+            best[total] = candidate
+
+        table = {"limit": limit, "trucks": trucks, "last": last, "best": best}
+        self._tables[by_volume] = table
+        return table
+
+    def plan(self, quantity, base_unit):
+        """
+        Подбирает машины для quantity единиц товара.
+        Возвращает словарь {truck_type_id: количество машин}.
+        """
+        if quantity <= 0:
+            return {}
+        by_volume = base_unit in VOLUME_UNITS
+        needed = int(math.ceil(quantity))
+        table = self._table(by_volume, needed)
+
+        total = table["best"][needed]
+        plan = {}
+        while total:
+            truck_id, capacity = table["last"][total]
+            plan[truck_id] = plan.get(truck_id, 0) + 1
+            total -= capacity
+        return plan
+
+    def describe(self, plan):
+        """Человекочитаемое описание плана, как в сводке машин заказа"""
+        names = {truck_id: name for truck_id, name, _, _ in self.truck_types}
+        return ", ".join(f"{names[truck_id]} × {count}" for truck_id, count in plan.items())
+
+
+def load_planner(db):
+    """Планировщик по текущему справочнику типов машин"""
+    return TruckPlanner(db.execute(select(TruckType)).scalars().all())
+
+
+class PlannerCache:
+    """
+    Планировщик в памяти процесса: таблицы динамики строятся один раз
+    и переиспользуются запросами. Версия типов машин сверяется с БД не чаще
+    раза в PLANNER_CHECK_INTERVAL секунд; при ее изменении планировщик
+    создается заново.
+    """
+
+    def __init__(self):
+        self._planner = None
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._planner is not None and time.monotonic() - self._checked_at < PLANNER_CHECK_INTERVAL:
+                return self._planner
+            with get_db() as db:
+                version = get_model_version(db, TRUCK_VERSION_NAME)
+                if self._planner is None or version != self.version:
+                    self._planner = load_planner(db)
+                    self.version = version
+            self._checked_at = time.monotonic()
+            return self._planner
+
+    def invalidate(self, tables=None):
+        """Сбрасывает планировщик, если изменились типы машин (tables не задан — всегда)"""
+        if tables is None or TRUCK_VERSION_NAME in tables:
+            with self._lock:
+                self._planner = None
+
+
+planner_cache = PlannerCache()
+on_tables_committed(planner_cache.invalidate)
+
+
+def assign_trucks(db, order_ids, planner=None):
+    """
+    Заменяет машины открытых заказов order_ids подобранными.
+    Закрытые заказы и заказы больше PLAN_MAX_QUANTITY пропускаются, их машины
+    не меняются. Изменения выполняются пачками Core-запросов в транзакции сессии db.
+    Возвращает количество обработанных заказов.
+    """
+    planner = planner or load_planner(db)
+    rows = db.execute(
+        select(Order.id, Order.quantity, ProductType.base_unit)
+        .join(ProductType, ProductType.id == Order.product_id)
+        .where(
+            Order.id.in_(order_ids),
+            Order.status.in_(OPEN_STATUSES),
+            Order.quantity <= PLAN_MAX_QUANTITY,
+        )
+    ).all()
+    if not rows:
+        return 0
+
+    truck_rows = []
+    for order_id, quantity, base_unit in rows:
+        for truck_type_id, count in planner.plan(quantity, base_unit).items():
+            truck_rows.append({"order_id": order_id, "truck_type_id": truck_type_id, "count": count})
+
+    db.execute(delete(OrderTruck).where(OrderTruck.order_id.in_([row[0] for row in rows])))
+    if truck_rows:
+        db.execute(insert(OrderTruck), truck_rows)
+    return len(rows)
+
+
+def plan_open_orders(batch_size=5000):
+    """
+    Пакетный пересчет машин для всех открытых заказов, каждый пакет коммитится
+    отдельно, чтобы не держать блокировку записи на весь пересчет.
+    Возвращает количество обработанных и пропущенных (больше PLAN_MAX_QUANTITY) заказов.
+    """
+    processed = 0
+    with get_db() as db:
+        planner = load_planner(db)
+        order_ids = db.execute(
+            select(Order.id).where(Order.status.in_(OPEN_STATUSES)).order_by(Order.id)
+        ).scalars().all()
+        for start in range(0, len(order_ids), batch_size):
+            processed += assign_trucks(db, order_ids[start:start + batch_size], planner)
+            db.commit()
+    return processed, len(order_ids) - processed
+
+
+router = APIRouter(prefix="/api/trucks", tags=["trucks"])
+
+
+def _plan_response(planner, plan):
+    return {
+        "trucks": [{"truck_type_id": truck_id, "count": count} for truck_id, count in plan.items()],
+        "summary": planner.describe(plan),
+    }
+
+
+@router.get("/plan")
+def plan_quantity(
+    quantity: float = Query(..., gt=0, le=PLAN_MAX_QUANTITY, description="Количество товара"),
+    base_unit: str = Query("тонна", description="Единица измерения товара"),
+):
+    """Подбор машин для произвольного количества товара"""
+    planner = planner_cache.get()
+    return _plan_response(planner, planner.plan(quantity, base_unit))
+
+
+@router.get("/plan/orders/{order_id}")
+def plan_order(order_id: int):
+    """Подбор машин для заказа (без сохранения)"""
+    with get_db() as db:
+        row = db.execute(
+            select(Order.quantity, ProductType.base_unit)
+            .join(ProductType, ProductType.id == Order.product_id)
+            .where(Order.id == order_id)
+        ).first()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Заказ не найден")
+    if row.quantity > PLAN_MAX_QUANTITY:
+        raise HTTPException(status_code=422, detail=f"Количество больше {PLAN_MAX_QUANTITY}")
+    planner = planner_cache.get()
+    return _plan_response(planner, planner.plan(row.quantity, row.base_unit))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Подбор машин для открытых заказов")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Заказов в одной пачке")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    count, skipped = plan_open_orders(batch_size=args.batch_size)
+    print(f"✅ Машины подобраны для {count} заказов за {time.perf_counter() - started:.1f} с")
+    if skipped:
+        print(f"⚠️ Пропущено заказов больше {PLAN_MAX_QUANTITY}: {skipped}")
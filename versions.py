@@ -0,0 +1,76 @@
+# versions.py
+from itertools import chain
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from database import upsert_insert
+from models import ModelVersion
+
+# Функции, вызываемые после коммита с множеством измененных таблиц
+_commit_callbacks = []
+# Таблицы, версии которых растут при изменениях через ORM (от них зависят кеши)
+_tracked_tables = set()
+
+
+def get_model_version(db, name):
+    """Текущая версия данных таблицы name (0, если изменений еще не было)"""
+    return db.execute(select(ModelVersion.version).where(ModelVersion.name == name)).scalar() or 0
+
+
+def bump_model_version(db, name):
+    """
+    Увеличивает версию данных таблицы name в текущей транзакции
+    (db — сессия или соединение). Другие воркеры сравнивают ее со своей,
+    чтобы обнаружить устаревший кеш. Возвращает новую версию.
+    """
+    dialect = db.dialect if hasattr(db, "dialect") else db.get_bind().dialect
+    stmt = upsert_insert(ModelVersion, dialect.name).values(name=name, version=1)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["name"], set_={"version": ModelVersion.version + 1}
+    ))
+    return get_model_version(db, name)
+
+
+def track_model_versions(*names):
+    """
+    Включает учет версий таблиц names. Изменения остальных таблиц через ORM
+    версий не увеличивают, чтобы частые записи не упирались в строку modelversion.
+    """
+    _tracked_tables.update(names)
+
+
+def on_tables_committed(callback):
+    """Регистрирует callback(tables), вызываемый после коммита изменений через ORM"""
+    _commit_callbacks.append(callback)
+    return callback
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_changed_tables(session, flush_context):
+    """Версии отслеживаемых таблиц, измененных через ORM, растут в той же транзакции"""
+    tables = {
+        obj.__table__.name
+        for obj in chain(session.new, session.deleted, session.dirty)
+        if getattr(obj, "__tablename__", None) in _tracked_tables
+        and (obj not in session.dirty or session.is_modified(obj))
+    }
+    if not tables:
+        return
+    connection = session.connection()
+    for name in sorted(tables):
+        bump_model_version(connection, name)
+    session.info.setdefault("changed_tables", set()).update(tables)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_committed(session):
+    tables = session.info.pop("changed_tables", None)
+    if tables:
+        for callback in _commit_callbacks:
+            callback(tables)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session):
+    session.info.pop("changed_tables", None)